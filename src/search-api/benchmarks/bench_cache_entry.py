@@ -0,0 +1,70 @@
+"""
+Size of the cached search entries and decode time of a cache hit, by number of answers.
+
+Entries were the JSON of the model, parsed with validation, and each suggestion token stored a copy of the entry. They are now compact JSON, constructed without validation, and tokens store the key of the entry.
+"""
+
+from benchmarks.harness import report, workshop_metadata
+from models.search import SearchAnswerModel, SearchModel, SearchStatsModel
+from uuid import UUID, uuid4
+import main
+import timeit
+
+ANSWERS_LEVELS = [1, 10, 50]
+DECODES = 1000
+
+
+def search_model(answers: int) -> SearchModel:
+    return SearchModel(
+        answers=[
+            SearchAnswerModel(
+                id=UUID(int=i + 1), metadata=workshop_metadata(i), score=1 / (i + 1)
+            )
+            for i in range(answers)
+        ],
+        query="azure functions",
+        stats=SearchStatsModel(time=0.125, total=answers),
+        suggestion_token=uuid4(),
+    )
+
+
+def main_bench() -> None:
+    rows = []
+    for answers in ANSWERS_LEVELS:
+        search = search_model(answers)
+        validated = search.json().encode("utf-8")
+        compact = main.search_entry_dumps(search)
+        reference = f"search:{search.query}-10".encode("utf-8")
+
+        validated_secs = timeit.timeit(
+            lambda: SearchModel.parse_raw(validated), number=DECODES
+        )
+        compact_secs = timeit.timeit(
+            lambda: main.search_entry_loads(compact), number=DECODES
+        )
+        rows += [
+            [
+                answers,
+                "validated",
+                len(validated),
+                len(validated),
+                validated_secs / DECODES * 1e6,
+            ],
+            [
+                answers,
+                "compact",
+                len(compact),
+                len(reference),
+                compact_secs / DECODES * 1e6,
+            ],
+        ]
+
+    report(
+        "Cached search entries",
+        ["answers", "format", "entry bytes", "token bytes", "decode (µs)"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,69 @@
+"""
+Latency of /search by number of concurrent requests, with the remote services answering in constant time.
+
+The same load is run with stubs blocking the event loop, as the synchronous clients did, to compare: the tail latency of blocking clients climbs with the concurrency, the one of the async clients stays flat.
+"""
+
+from benchmarks.harness import (
+    TOPICS,
+    Stubs,
+    concurrently,
+    percentile,
+    report,
+    stores_setup,
+)
+from uuid import uuid4
+import asyncio
+import main
+import time
+
+CONCURRENCY_LEVELS = [1, 4, 16, 32]
+# Requests of each level, as a multiple of its concurrency
+REQUESTS_PER_CLIENT = 4
+SERVICE_DELAY_SECS = 0.05  # 50 ms
+
+
+async def run(blocking: bool) -> list:
+    rows = []
+    for concurrency in CONCURRENCY_LEVELS:
+        await stores_setup(qdrant_delay=SERVICE_DELAY_SECS)
+        Stubs(
+            embedding=SERVICE_DELAY_SECS,
+            moderation=SERVICE_DELAY_SECS,
+            blocking=blocking,
+        ).install()
+        user = uuid4()
+        # Queries are all different, none is answered from a cache
+        level = f"level{concurrency}"
+
+        async def search(i: int) -> None:
+            await main.search(f"{TOPICS[i % len(TOPICS)]} {level} {i}", user)
+
+        count = concurrency * REQUESTS_PER_CLIENT
+        start = time.monotonic()
+        durations = await concurrently(count, search, concurrency)
+        throughput = count / (time.monotonic() - start)
+        rows.append(
+            [
+                "blocking" if blocking else "async",
+                concurrency,
+                count,
+                percentile(durations, 50),
+                percentile(durations, 99),
+                throughput,
+            ]
+        )
+    return rows
+
+
+def main_bench() -> None:
+    rows = asyncio.run(run(False)) + asyncio.run(run(True))
+    report(
+        f"/search latency (s), services answering in {SERVICE_DELAY_SECS}s",
+        ["clients", "concurrency", "requests", "p50", "p99", "req/s"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,149 @@
+"""
+Wall time of an indexing run by concurrency of its stages, against a local HTTP server.
+
+The server serves the feed and the workshop pages, and stubs the embedding endpoint of Azure OpenAI, each answer after a fixed delay. The scrape and embed stages are given the same concurrency, the clean stage keeps its process pool.
+"""
+
+from aiohttp import web
+from benchmarks.harness import TOPICS, report, stores_setup
+from typing import Dict
+from uuid import UUID, uuid4
+import asyncio
+import json
+import main
+
+CONCURRENCY_LEVELS = [1, 2, 4, 8]
+EMBEDDING_DELAY_SECS = 0.1  # 100 ms
+PAGE_DELAY_SECS = 0.05  # 50 ms
+PAGE_WORDS = 1500
+WORKSHOPS = 48
+
+
+class StubServer:
+    """
+    HTTP server of the feed, the pages and the embeddings, counting the requests by route.
+    """
+
+    def __init__(self) -> None:
+        self.requests: Dict[str, int] = {}
+        self.url = ""
+        self._runner = None
+        # Same vector for every text, the embeddings are not searched
+        self._vector = [1 / main.QD_DIMENSION**0.5] * main.QD_DIMENSION
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/workshops.json", self.feed)
+        app.router.add_get("/workshops/{id}/", self.page)
+        app.router.add_post(
+            "/openai/deployments/{deployment}/embeddings", self.embeddings
+        )
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self) -> None:
+        await self._runner.cleanup()
+
+    def count(self, route: str) -> None:
+        self.requests[route] = self.requests.get(route, 0) + 1
+
+    async def feed(self, req: web.Request) -> web.Response:
+        self.count("feed")
+        return web.json_response(
+            [
+                {
+                    "audience": ["developers"],
+                    "authors": ["MOAW"],
+                    "description": f"Learn {TOPICS[i % len(TOPICS)]}",
+                    "id": str(UUID(int=i + 1)),
+                    "language": "en",
+                    "lastUpdated": "2023-06-01T00:00:00+00:00",
+                    "tags": TOPICS[i % len(TOPICS)].split(" ")[:2],
+                    "title": f"Workshop {i}",
+                    "url": f"{self.url}/workshops/{i}/",
+                }
+                for i in range(WORKSHOPS)
+            ]
+        )
+
+    async def page(self, req: web.Request) -> web.Response:
+        self.count("page")
+        await asyncio.sleep(PAGE_DELAY_SECS)
+        topic = TOPICS[int(req.match_info["id"]) % len(TOPICS)]
+        words = (topic.split(" ") * PAGE_WORDS)[:PAGE_WORDS]
+        return web.Response(
+            content_type="text/html",
+            text=f"<html><body><h1>{topic}</h1><p>{' '.join(words)}</p></body></html>",
+        )
+
+    async def embeddings(self, req: web.Request) -> web.Response:
+        self.count("embeddings")
+        texts = (await req.json())["input"]
+        await asyncio.sleep(EMBEDDING_DELAY_SECS)
+        return web.Response(
+            content_type="application/json",
+            text=json.dumps(
+                {
+                    "data": [
+                        {"embedding": self._vector, "index": i, "object": "embedding"}
+                        for i in range(len(texts))
+                    ],
+                    "model": main.OAI_EMBEDDING_ARGS["model"],
+                    "object": "list",
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                }
+            ),
+        )
+
+
+async def run(concurrency: int) -> list:
+    await stores_setup(workshops=0)
+    server = StubServer()
+    await server.start()
+    main.INDEX_FEED_URL = f"{server.url}/workshops.json"
+    main.OAI_EMBEDDING_ARGS["deployment_id"] = "embedding"
+    main.openai.api_base = server.url
+    main.openai.api_key = "benchmark"
+    main.index_scrape_sem = asyncio.Semaphore(concurrency)
+    main.index_embed_sem = asyncio.Semaphore(concurrency)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await main.index_engine(uuid4(), force=True)
+    duration = loop.time() - start
+    await server.stop()
+
+    indexed = len(main.lexical_index)
+    return [
+        concurrency,
+        indexed,
+        server.requests.get("page", 0),
+        server.requests.get("embeddings", 0),
+        duration,
+        indexed / duration,
+    ]
+
+
+def main_bench() -> None:
+    # Starts the processes of the clean stage, not to count their start
+    asyncio.run(run(CONCURRENCY_LEVELS[-1]))
+    report(
+        f"Indexing of {WORKSHOPS} workshops, pages answered in {PAGE_DELAY_SECS}s, embeddings in {EMBEDDING_DELAY_SECS}s",
+        [
+            "concurrency",
+            "workshops",
+            "pages",
+            "embedding requests",
+            "wall time (s)",
+            "workshops/s",
+        ],
+        [asyncio.run(run(concurrency)) for concurrency in CONCURRENCY_LEVELS],
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
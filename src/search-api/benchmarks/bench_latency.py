@@ -0,0 +1,56 @@
+"""
+Latency of /search with delays injected in the remote services.
+
+Moderation and embedding run at the same time, so a search waits for the slowest of them, not for their sum. An embedding slower than its timeout is given up, the search is answered from the lexical index only.
+"""
+
+from benchmarks.harness import Stubs, percentile, report, stores_setup
+from uuid import uuid4
+import asyncio
+import main
+import time
+
+# Delays of moderation and embedding, in seconds
+DELAYS = [
+    (0.05, 0.05),
+    (0.2, 0.05),
+    (0.05, 0.2),
+    (0.2, 0.2),
+    (0.05, 5.0),
+]
+QDRANT_DELAY_SECS = 0.02  # 20 ms
+REQUESTS = 5
+
+
+async def run(moderation: float, embedding: float) -> list:
+    await stores_setup(qdrant_delay=QDRANT_DELAY_SECS)
+    stubs = Stubs(embedding=embedding, moderation=moderation)
+    stubs.install()
+    user = uuid4()
+
+    durations = []
+    for i in range(REQUESTS):
+        start = time.monotonic()
+        # Queries are all different, none is answered from a cache
+        await main.search(f"azure functions {moderation} {embedding} {i}", user)
+        durations.append(time.monotonic() - start)
+
+    return [
+        moderation,
+        embedding,
+        moderation + embedding,
+        max(moderation, min(embedding, main.SEARCH_EMBEDDING_TIMEOUT_SECS)),
+        percentile(durations, 50),
+    ]
+
+
+def main_bench() -> None:
+    report(
+        f"/search latency (s), Qdrant answering in {QDRANT_DELAY_SECS}s, embedding timeout of {main.SEARCH_EMBEDDING_TIMEOUT_SECS}s",
+        ["moderation", "embedding", "sum", "slowest", "measured p50"],
+        [asyncio.run(run(moderation, embedding)) for moderation, embedding in DELAYS],
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
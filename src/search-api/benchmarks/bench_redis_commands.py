@@ -0,0 +1,65 @@
+"""
+Redis commands and round-trips of a search and of a suggestion.
+
+Writes made back to back are pipelined, and the streamed tokens are grouped in messages, so a suggestion costs a few XADD instead of one per token.
+"""
+
+from benchmarks.harness import RedisCounter, Stubs, report, stores_setup
+from uuid import uuid4
+import asyncio
+import main
+
+COMPLETION_TOKENS = 200
+
+
+async def run() -> list:
+    counter = RedisCounter()
+    counter.install()
+    await stores_setup()
+    Stubs(
+        completion_first=0.05,
+        completion_token=0.005,
+        completion_tokens=COMPLETION_TOKENS,
+    ).install()
+    user = uuid4()
+    rows = []
+
+    def row(operation: str) -> None:
+        rows.append(
+            [
+                operation,
+                counter.commands,
+                counter.round_trips,
+                counter.commands_by_name.get("XADD", 0),
+            ]
+        )
+        counter.reset()
+
+    counter.reset()
+    search = await main.search("azure functions", user)
+    row("search, not cached")
+
+    await main.search("azure functions", user)
+    row("search, cached")
+
+    async for _ in main.suggestion_sse_generator(None, search, user, None):
+        pass
+    row(f"suggestion of {COMPLETION_TOKENS} tokens, generated")
+
+    async for _ in main.suggestion_sse_generator(None, search, user, None):
+        pass
+    row("suggestion, cached")
+
+    return rows
+
+
+def main_bench() -> None:
+    report(
+        "Redis commands by operation, one client",
+        ["operation", "commands", "round-trips", "XADD"],
+        asyncio.run(run()),
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
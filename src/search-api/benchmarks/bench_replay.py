@@ -0,0 +1,112 @@
+"""
+Offline replay of a query log, counting the embedding and completion calls saved by the caches.
+
+Each query is replayed as /search/stream would answer it, from the results to the end of the suggestion. Without any cache, each query costs one embedding and one completion. The log is replayed with the exact caches only, then with the semantic cache too.
+"""
+
+from benchmarks.harness import Stubs, percentile, report, stores_setup
+from models.search import SearchModel
+from typing import List, Tuple
+from uuid import UUID, uuid4
+import asyncio
+import main
+import os
+import time
+
+QUERIES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "queries.txt")
+SEARCH_LIMIT = 10
+
+
+async def replay(query: str, user: UUID, semantic: bool) -> None:
+    """
+    Answers the query as /search/stream, and reads its suggestion until the end.
+    """
+    start = time.monotonic()
+    cached = await main.search_from_cache(query, SEARCH_LIMIT, start)
+    if cached:
+        search, suggestion_query = cached
+    else:
+        vector_task = await main.search_start(query, user)
+        search, suggestion_query = await main.search_from_index(
+            query, SEARCH_LIMIT, start, vector_task, semantic=semantic
+        )
+
+    suggestion: SearchModel = search.copy(update={"query": suggestion_query})
+    async for _ in main.suggestion_sse_generator(None, suggestion, user, None):
+        pass
+
+
+async def run(queries: List[str], semantic: bool) -> Tuple[list, List[list]]:
+    await stores_setup()
+    stubs = Stubs(completion_first=0.1, completion_tokens=10)
+    stubs.install()
+    user = uuid4()
+
+    durations = []
+    for query in queries:
+        start = time.monotonic()
+        await replay(query, user, semantic)
+        durations.append(time.monotonic() - start)
+
+    caches = "exact and semantic" if semantic else "exact"
+    calls = [
+        caches,
+        stubs.calls["embedding"],
+        1 - stubs.calls["embedding"] / len(queries),
+        stubs.calls["completion"],
+        1 - stubs.calls["completion"] / len(queries),
+        percentile(durations, 50),
+        percentile(durations, 99),
+    ]
+    stats = [
+        [
+            caches,
+            family,
+            stats.hits,
+            stats.misses,
+            stats.hit_ratio,
+            float(stats.hit_latency) * 1000,
+            float(stats.miss_latency) * 1000,
+        ]
+        for family, stats in sorted(main.cache_stats.items())
+    ]
+    return (calls, stats)
+
+
+def main_bench() -> None:
+    with open(QUERIES_PATH, encoding="utf-8") as f:
+        queries = [line.rstrip("\n") for line in f if line.strip()]
+
+    exact_calls, exact_stats = asyncio.run(run(queries, False))
+    semantic_calls, semantic_stats = asyncio.run(run(queries, True))
+
+    report(
+        f"Replay of {len(queries)} queries, without cache each one costs an embedding and a completion",
+        [
+            "caches",
+            "embeddings",
+            "saved",
+            "completions",
+            "saved",
+            "query p50 (s)",
+            "query p99 (s)",
+        ],
+        [exact_calls, semantic_calls],
+    )
+    report(
+        "Cache statistics of the replays",
+        [
+            "caches",
+            "family",
+            "hits",
+            "misses",
+            "hit ratio",
+            "hit latency (ms)",
+            "miss latency (ms)",
+        ],
+        exact_stats + semantic_stats,
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,120 @@
+"""
+Throughput of the page sanitizer, against the regex chain it replaced, over a corpus of workshop pages.
+
+Pages are read from the directory given as argument, as saved from the MOAW feed, or generated with the shape of a MOAW workshop: Markdown headings, paragraphs, lists, tables, links, images and code blocks, in an HTML page. Outputs of both are compared first, the benchmark fails if any page differs.
+"""
+
+from benchmarks.harness import report
+from sanitizer import sanitize_for_embedding
+from typing import List
+import html
+import os
+import random
+import re
+import sys
+import timeit
+
+PAGES = 40
+REPEATS = 5
+WORDS = "azure functions deploy container kubernetes cluster the a of to and cloud serverless workshop lab step resource group app service".split()
+
+
+def sanitize_previous(raw: str) -> str:
+    """
+    Regex chain replaced by sanitize_for_embedding.
+    """
+    raw = re.sub(r"<!DOCTYPE[^>]*>", " ", raw)
+    raw = re.sub(r"<head\b[^>]*>[\s\S]*<\/head>", " ", raw)
+    raw = re.sub(r"<script\b[^>]*>[\s\S]*?<\/script>", " ", raw)
+    raw = re.sub(r"<style\b[^>]*>[\s\S]*?<\/style>", " ", raw)
+    raw = re.sub(r"<[^>]*>", " ", raw)
+    raw = re.sub(r"[-|]{2,}", " ", raw)
+    raw = re.sub(r"```[\s\S]*```", " ", raw)
+    raw = re.sub(r"[*_`~#|!\[\]<>-]+", " ", raw)
+    raw = re.sub(r"[\n\t\v ]+", " ", raw)
+    raw = html.unescape(raw)
+    return raw.strip()
+
+
+def page_generate(rnd: random.Random) -> str:
+    """
+    Returns a page with the shape of a MOAW workshop.
+    """
+
+    def text(low: int, high: int) -> str:
+        return " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(low, high)))
+
+    sections = []
+    for _ in range(rnd.randint(40, 200)):
+        kind = rnd.random()
+        if kind < 0.1:
+            sections.append(f"## {text(2, 6)}\n")
+        elif kind < 0.2:
+            sections.append(
+                f"| {text(1, 3)} | {text(1, 3)} |\n|---|---|\n| {text(2, 8)} | {text(2, 8)} |\n"
+            )
+        elif kind < 0.3:
+            sections.append(
+                f"```bash\naz group create --name {rnd.choice(WORDS)} --location westeurope\n```\n"
+            )
+        elif kind < 0.45:
+            sections.append(
+                f"- **{text(1, 3)}**: {text(5, 20)} [{text(1, 3)}](https://learn.microsoft.com/{rnd.choice(WORDS)})\n"
+            )
+        elif kind < 0.5:
+            sections.append(f"![{text(1, 3)}](assets/{rnd.choice(WORDS)}.png)\n")
+        elif kind < 0.55:
+            sections.append(
+                f'<div class="tip" markdown>{text(5, 20)} &amp; {text(2, 5)}</div>\n'
+            )
+        else:
+            sections.append(f"{text(10, 80)}\n")
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Workshop</title>'
+        "<style>body { margin: 0; }</style><script>var ready = 1 < 2;</script></head>"
+        '<body><script src="analytics.js"></script>'
+        + "\n".join(sections)
+        + "<style>.tip { color: blue; }</style></body></html>"
+    )
+
+
+def corpus_load() -> List[str]:
+    if len(sys.argv) > 1:
+        pages = []
+        for name in sorted(os.listdir(sys.argv[1])):
+            with open(os.path.join(sys.argv[1], name), encoding="utf-8") as f:
+                pages.append(f.read())
+        return pages
+
+    rnd = random.Random(0)
+    return [page_generate(rnd) for _ in range(PAGES)]
+
+
+def main_bench() -> None:
+    pages = corpus_load()
+    for i, page in enumerate(pages):
+        if sanitize_for_embedding(page) != sanitize_previous(page):
+            sys.exit(f"Page {i} is not sanitized as before")
+
+    size = sum(len(page.encode("utf-8")) for page in pages)
+    rows = []
+    for name, sanitize in [
+        ("previous", sanitize_previous),
+        ("current", sanitize_for_embedding),
+    ]:
+        secs = min(
+            timeit.repeat(
+                lambda: [sanitize(page) for page in pages], number=1, repeat=REPEATS
+            )
+        )
+        rows.append([name, secs / len(pages) * 1000, size / secs / 1e6])
+
+    report(
+        f"Sanitization of {len(pages)} pages ({size / 1e3:.0f} kB), best of {REPEATS}, same outputs",
+        ["sanitizer", "per page (ms)", "MB/s"],
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
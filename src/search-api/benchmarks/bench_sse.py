@@ -0,0 +1,80 @@
+"""
+Redis load and time to first token of a suggestion streamed to many SSE clients at once.
+
+Clients of a worker share one blocking reader per stream, so the Redis commands per second stay flat per client, whatever the number of clients.
+"""
+
+from benchmarks.harness import (
+    RedisCounter,
+    Stubs,
+    percentile,
+    report,
+    stores_setup,
+)
+from models.search import SearchModel, SearchStatsModel
+from typing import List
+from uuid import uuid4
+import asyncio
+import main
+import time
+
+CLIENTS_LEVELS = [10, 100, 1000]
+
+
+async def run(clients: int, counter: RedisCounter) -> list:
+    await stores_setup()
+    Stubs().install()
+    search = SearchModel(
+        answers=[],
+        query=f"azure functions {clients}",
+        stats=SearchStatsModel(time=0, total=0),
+        suggestion_token=uuid4(),
+    )
+    user = uuid4()
+    start = time.monotonic()
+
+    async def listen() -> float:
+        ttft = None
+        async for message in main.suggestion_sse_generator(None, search, user, None):
+            if ttft is None and isinstance(message, dict) and "event" not in message:
+                ttft = time.monotonic() - start
+        return ttft
+
+    counter.reset()
+    ttfts: List[float] = await asyncio.gather(*[listen() for _ in range(clients)])
+    duration = time.monotonic() - start
+    return [
+        clients,
+        counter.commands,
+        counter.commands / clients,
+        counter.round_trips,
+        counter.commands / duration / clients * 1000,
+        percentile(ttfts, 50),
+        percentile(ttfts, 99),
+    ]
+
+
+async def run_all() -> List[list]:
+    counter = RedisCounter()
+    counter.install()
+    return [await run(clients, counter) for clients in CLIENTS_LEVELS]
+
+
+def main_bench() -> None:
+    report(
+        "Suggestion streamed to concurrent SSE clients, first token after 0.2s, then 50 tokens every 0.01s",
+        [
+            "clients",
+            "commands",
+            "per client",
+            "round-trips",
+            "commands/s per 1k",
+            "TTFT p50",
+            "TTFT p99",
+        ],
+        asyncio.run(run_all()),
+    )
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,350 @@
+"""
+Shared setup of the benchmarks, run offline from the directory of the API with "python -m benchmarks.<name>".
+
+Redis is replaced by fakeredis and Qdrant by its in-memory client. OpenAI and Content Safety are replaced by stubs answering after a configurable delay, and counting their calls. Without access to the OpenAI encodings, tokens are counted per word.
+"""
+
+import os
+
+# Clients are created at the import of the API, without connecting, they only need their settings
+os.environ.setdefault("MS_ACS_API_BASE", "https://localhost")
+os.environ.setdefault("MS_ACS_API_TOKEN", "benchmark")
+os.environ.setdefault("MS_QD_HOST", "localhost")
+os.environ.setdefault("MS_REDIS_HOST", "localhost")
+os.environ.setdefault("VERSION", "0.0.0-benchmark")
+
+from bm25 import Bm25Index
+from models.metadata import MetadataModel
+from models.stats import CollectionStatsModel
+from qdrant_client import AsyncQdrantClient
+from redis.asyncio.connection import Connection
+from types import SimpleNamespace
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional
+from uuid import UUID
+import asyncio
+import fakeredis
+import hashlib
+import logging
+import main
+import math
+import qdrant_client.http.models as qmodels
+import re
+import time
+
+# Topics of the synthetic workshops, each one has a title, a description and a content made of its words
+TOPICS = [
+    "azure functions serverless",
+    "azure kubernetes service cluster",
+    "container apps microservices",
+    "cosmos db nosql database",
+    "github actions deployment pipeline",
+    "openai embeddings search",
+    "static web apps frontend",
+    "terraform infrastructure code",
+    "event hubs streaming",
+    "api management gateway",
+    "machine learning training",
+    "monitoring logs metrics",
+]
+
+
+class WordEncoding:
+    """
+    Encoding with a token per word, used when the OpenAI encodings cannot be downloaded.
+    """
+
+    def encode(self, text: str, **kwargs) -> list:
+        return text.split(" ")
+
+    def decode(self, tokens: list) -> str:
+        return " ".join(tokens)
+
+
+class RedisCounter:
+    """
+    Counts the commands sent to Redis, in total and by name, and the round-trips carrying them, by all the clients.
+    """
+
+    def __init__(self) -> None:
+        self.commands = 0
+        self.commands_by_name: Dict[str, int] = {}
+        self.round_trips = 0
+
+    def install(self) -> None:
+        pack_command = Connection.pack_command
+        send_packed_command = Connection.send_packed_command
+        counter = self
+
+        def pack_command_counted(self, *args):
+            counter.commands += 1
+            name = str(args[0]).upper()
+            counter.commands_by_name[name] = counter.commands_by_name.get(name, 0) + 1
+            return pack_command(self, *args)
+
+        async def send_packed_command_counted(self, *args, **kwargs):
+            counter.round_trips += 1
+            return await send_packed_command(self, *args, **kwargs)
+
+        Connection.pack_command = pack_command_counted
+        Connection.send_packed_command = send_packed_command_counted
+
+    def reset(self) -> None:
+        self.commands = 0
+        self.commands_by_name.clear()
+        self.round_trips = 0
+
+
+class Stubs:
+    """
+    Stubs of OpenAI and Content Safety, answering after their delay, in seconds.
+
+    Embeddings are hashed bags of words, so queries sharing their words are similar. Completions stream the words of a fixed answer. With blocking, delays block the event loop, as a synchronous client would.
+    """
+
+    def __init__(
+        self,
+        moderation: float = 0.05,
+        embedding: float = 0.05,
+        completion_first: float = 0.2,
+        completion_token: float = 0.01,
+        completion_tokens: int = 50,
+        blocking: bool = False,
+    ) -> None:
+        self.blocking = blocking
+        self.calls: Dict[str, int] = {"completion": 0, "embedding": 0, "moderation": 0}
+        self.completion_first = completion_first
+        self.completion_token = completion_token
+        self.completion_tokens = completion_tokens
+        self.embedding = embedding
+        self.moderation = moderation
+
+    def install(self) -> None:
+        main.openai.ChatCompletion.acreate = self.completion_create
+        main.openai.Embedding.acreate = self.embedding_create
+        main.acs_client.analyze_text = self.moderation_analyze
+
+    async def sleep(self, delay: float) -> None:
+        if self.blocking:
+            time.sleep(delay)
+        else:
+            await asyncio.sleep(delay)
+
+    async def moderation_analyze(self, req) -> SimpleNamespace:
+        self.calls["moderation"] += 1
+        await self.sleep(self.moderation)
+        return SimpleNamespace(
+            hate_result=None,
+            self_harm_result=None,
+            sexual_result=None,
+            violence_result=None,
+        )
+
+    async def embedding_create(self, input: List[str], **kwargs) -> SimpleNamespace:
+        self.calls["embedding"] += 1
+        await self.sleep(self.embedding)
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(embedding=hashed_vector(text), index=i)
+                for i, text in enumerate(input)
+            ]
+        )
+
+    async def completion_create(self, **kwargs) -> AsyncGenerator[dict, None]:
+        self.calls["completion"] += 1
+        await self.sleep(self.completion_first)
+
+        async def chunks() -> AsyncGenerator[dict, None]:
+            for i in range(self.completion_tokens):
+                if i:
+                    await self.sleep(self.completion_token)
+                yield {"choices": [{"delta": {"content": f" word{i}"}}]}
+
+        return chunks()
+
+
+class QdrantStub:
+    """
+    Qdrant answering after its delay, in seconds, with the same workshops to every search, and no similar query cached.
+
+    Searches cost no CPU, unlike the in-memory client, so latencies only measure the API.
+    """
+
+    def __init__(self, points: List[qmodels.PointStruct], delay: float) -> None:
+        self._delay = delay
+        self._points = {point.id: point for point in points}
+
+    async def retrieve(self, ids: List[str], **kwargs) -> List[qmodels.Record]:
+        await asyncio.sleep(self._delay)
+        return [
+            qmodels.Record(id=id, payload=self._points[id].payload)
+            for id in ids
+            if id in self._points
+        ]
+
+    async def search(self, **kwargs) -> List[qmodels.ScoredPoint]:
+        await asyncio.sleep(self._delay)
+        return []
+
+    async def search_groups(self, limit: int, **kwargs) -> qmodels.GroupsResult:
+        await asyncio.sleep(self._delay)
+        return qmodels.GroupsResult(
+            groups=[
+                qmodels.PointGroup(
+                    hits=[
+                        qmodels.ScoredPoint(
+                            id=point.id, payload=point.payload, score=1, version=0
+                        )
+                    ],
+                    id=point.payload["workshop_id"],
+                )
+                for point in list(self._points.values())[:limit]
+            ]
+        )
+
+    async def upsert(self, **kwargs) -> None:
+        await asyncio.sleep(self._delay)
+
+
+def hashed_vector(text: str) -> List[float]:
+    """
+    Returns the normalized bag of words of the text, hashed in the dimensions of the embeddings.
+    """
+    vector = [0.0] * main.QD_DIMENSION
+    for word in re.findall(r"\w+", text.lower()):
+        if word in ("query", "start", "end"):
+            continue
+        digest = hashlib.md5(word.encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % main.QD_DIMENSION] += 1
+    norm = math.sqrt(sum(value * value for value in vector)) or 1
+    return [value / norm for value in vector]
+
+
+def workshop_metadata(i: int) -> MetadataModel:
+    topic = TOPICS[i % len(TOPICS)]
+    return MetadataModel(
+        audience=["developers"],
+        authors=["MOAW"],
+        description=f"Learn {topic}, step by step",
+        language="en",
+        last_updated="2023-06-01T00:00:00",
+        tags=topic.split(" ")[:2],
+        title=f"Workshop {i}: {topic}",
+        url=f"https://example.com/workshop-{i}/",
+    )
+
+
+def encoding_setup() -> None:
+    """
+    Counts tokens per word if the OpenAI encodings are not available.
+    """
+    try:
+        main.tiktoken.encoding_for_model(main.OAI_EMBEDDING_ARGS["model"])
+    except Exception:
+        encoding = WordEncoding()
+        main.tiktoken.encoding_for_model = lambda model: encoding
+
+
+async def stores_setup(
+    workshops: int = 24, qdrant_delay: Optional[float] = None
+) -> fakeredis.aioredis.FakeRedis:
+    """
+    Replaces Redis and Qdrant by local stores, and indexes the synthetic workshops in them.
+
+    With qdrant_delay, Qdrant is replaced by QdrantStub, answering after this delay, in seconds.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    main.logger.setLevel(logging.WARNING)
+    encoding_setup()
+
+    redis = fakeredis.aioredis.FakeRedis()
+    main.redis_client_api = redis
+    # Caches of the worker are emptied with the stores
+    for cache in [main.embedding_cache, main.moderation_cache, main.prompt_block_cache]:
+        cache.clear()
+    main.cache_stats.clear()
+    # Semaphores are bound to the event loop of their first use, each run has its own
+    main.index_clean_sem = asyncio.Semaphore(main.INDEX_CLEAN_CONCURRENCY)
+    main.index_embed_sem = asyncio.Semaphore(main.INDEX_EMBED_CONCURRENCY)
+    main.index_scrape_sem = asyncio.Semaphore(main.INDEX_SCRAPE_CONCURRENCY)
+    main.oai_completion_sem = asyncio.Semaphore(main.OAI_COMPLETION_CONCURRENCY)
+
+    points = []
+    documents = {}
+    for i in range(workshops):
+        workshop_id = str(UUID(int=i + 1))
+        metadata = workshop_metadata(i)
+        content = " ".join([metadata.title, metadata.description] * 10)
+        points.append(
+            qmodels.PointStruct(
+                id=main.chunk_id(workshop_id, 0),
+                payload={**metadata.dict(), "chunk": 0, "workshop_id": workshop_id},
+                vector=hashed_vector(content),
+            )
+        )
+        documents[workshop_id] = main.lexical_text_from_metadata(
+            metadata, metadata.description, content
+        )
+
+    if qdrant_delay is None:
+        main.qd_client = AsyncQdrantClient(location=":memory:")
+        for collection, metric in [
+            (main.QD_COLLECTION, main.QD_METRIC),
+            (main.QD_COLLECTION_QUERIES, main.QD_METRIC_QUERIES),
+        ]:
+            await main.qd_client.create_collection(
+                collection_name=collection,
+                vectors_config=qmodels.VectorParams(
+                    distance=metric, size=main.QD_DIMENSION
+                ),
+            )
+        await main.qd_client.upsert(collection_name=main.QD_COLLECTION, points=points)
+    else:
+        main.qd_client = QdrantStub(points, qdrant_delay)
+
+    main.lexical_index = Bm25Index()
+    await main.lexical_index_update(documents, [])
+    main.collection_stats = CollectionStatsModel(
+        languages={"en": workshops}, tags={}, total=workshops
+    )
+    return redis
+
+
+async def concurrently(
+    count: int, run: Callable[[int], Awaitable[None]], concurrency: Optional[int] = None
+) -> List[float]:
+    """
+    Runs count calls of run, concurrency at a time, and returns their durations, in seconds.
+    """
+    sem = asyncio.Semaphore(concurrency or count)
+
+    async def timed(i: int) -> float:
+        async with sem:
+            start = time.monotonic()
+            await run(i)
+            return time.monotonic() - start
+
+    return await asyncio.gather(*[timed(i) for i in range(count)])
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Returns the percentile p (0 to 100) of the values, with the nearest-rank method.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def report(title: str, header: List[str], rows: List[list]) -> None:
+    """
+    Prints a table, floats with 3 decimals.
+    """
+    cells = [header] + [
+        [f"{cell:.3f}" if isinstance(cell, float) else str(cell) for cell in row]
+        for row in rows
+    ]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    print(f"\n{title}\n")
+    for i, row in enumerate(cells):
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+        if i == 0:
+            print("  ".join("-" * width for width in widths))
@@ -0,0 +1,147 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+import json
+import math
+import re
+import unicodedata
+import zlib
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Returns the terms of a text, normalized for matching (NFKC, case-folded).
+    """
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold())
+
+
+class Bm25Index:
+    """
+    In-process inverted index, scored with Okapi BM25.
+
+    Documents are identified by a string ID. Only term frequencies are kept, not the texts. Not thread-safe, an index is modified by one thread at a time, and not searched meanwhile.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self._b = b
+        self._k1 = k1
+        # Document ID -> length in terms
+        self._lengths: Dict[str, int] = {}
+        # Term -> document ID -> term frequency
+        self._postings: Dict[str, Dict[str, int]] = {}
+        # Document ID -> terms, so a removal only touches the postings of the document
+        self._terms: Dict[str, List[str]] = {}
+        self._total_length = 0
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._lengths
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """
+        Indexes a document, replacing the previous version if any.
+        """
+        self.remove(doc_id)
+
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        self._lengths[doc_id] = length
+        self._terms[doc_id] = list(terms.keys())
+        self._total_length += length
+
+    def remove(self, doc_id: str) -> None:
+        """
+        Removes a document from the index. Unknown documents are ignored.
+        """
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+
+        self._total_length -= length
+        for term in self._terms.pop(doc_id):
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+
+    def search(self, query: str, limit: int) -> List[Tuple[str, float]]:
+        """
+        Returns the IDs and the scores of the best documents for the query, best first.
+        """
+        if not self._lengths:
+            return []
+
+        count = len(self._lengths)
+        length_avg = self._total_length / count
+        scores: Dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = self._k1 * (
+                    1 - self._b + self._b * self._lengths[doc_id] / length_avg
+                )
+                scores[doc_id] = scores.get(doc_id, 0) + idf * (
+                    frequency * (self._k1 + 1) / (frequency + norm)
+                )
+
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    def dumps(self) -> bytes:
+        """
+        Serializes the index, as compressed JSON.
+
+        Document IDs are stored once, postings reference them by position.
+        """
+        doc_ids = list(self._lengths.keys())
+        positions = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        data = {
+            "b": self._b,
+            "docs": doc_ids,
+            "k1": self._k1,
+            "lengths": [self._lengths[doc_id] for doc_id in doc_ids],
+            "postings": {
+                term: [
+                    value
+                    for doc_id, frequency in postings.items()
+                    for value in (positions[doc_id], frequency)
+                ]
+                for term, postings in self._postings.items()
+            },
+        }
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def loads(cls, raw: bytes) -> "Bm25Index":
+        """
+        Deserializes an index serialized with dumps.
+        """
+        data = json.loads(zlib.decompress(raw))
+        index = cls(k1=data["k1"], b=data["b"])
+        doc_ids: List[str] = data["docs"]
+        index._lengths = dict(zip(doc_ids, data["lengths"]))
+        index._total_length = sum(data["lengths"])
+        index._postings = {
+            term: dict(_pairs(doc_ids, values))
+            for term, values in data["postings"].items()
+        }
+        index._terms = {doc_id: [] for doc_id in doc_ids}
+        for term, postings in index._postings.items():
+            for doc_id in postings:
+                index._terms[doc_id].append(term)
+        return index
+
+
+def _pairs(doc_ids: List[str], values: List[int]) -> Iterable[Tuple[str, int]]:
+    for i in range(0, len(values), 2):
+        yield (doc_ids[values[i]], values[i + 1])
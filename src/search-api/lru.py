@@ -0,0 +1,46 @@
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, Tuple, TypeVar
+import time
+
+
+T = TypeVar("T")
+
+
+class LruCache(Generic[T]):
+    """
+    In-process LRU cache, with a maximum number of entries and a TTL per entry.
+
+    Not thread-safe, it is meant to be used from the event loop only.
+    """
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self._entries: OrderedDict[Hashable, Tuple[float, T]] = OrderedDict()
+        self._size = size
+        self._ttl = ttl
+
+    def get(self, key: Hashable) -> Optional[T]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: T, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self._ttl if ttl is None else ttl)
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
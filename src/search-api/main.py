@@ -8,12 +8,15 @@ load_dotenv(find_dotenv())
 from apscheduler.jobstores.redis import RedisJobStore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-import azure.ai.contentsafety as azure_cs
+from azure.ai.contentsafety.aio import ContentSafetyClient
 from azure.core.credentials import AzureKeyCredential
-from azure.identity import DefaultAzureCredential
+from azure.identity.aio import DefaultAzureCredential
+from bm25 import Bm25Index
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from fastapi import (
     FastAPI,
+    Header,
     HTTPException,
     Query,
     BackgroundTasks,
@@ -21,33 +24,73 @@ from fastapi import (
     Response,
     Request,
 )
+from array import array
 from fastapi.middleware.cors import CORSMiddleware
+from lru import LruCache
+from models.cache import CacheStatsModel
+from models.http import HttpValidatorModel
 from models.metadata import MetadataModel
+from models.moderation import ModerationModel
 from models.readiness import (
     ReadinessModel,
     ReadinessCheckModel,
     Status as ReadinessStatus,
 )
 from models.search import SearchAnswerModel, SearchStatsModel, SearchModel
-from qdrant_client import QdrantClient
-from redis import Redis
+from models.stats import CollectionStatsModel
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    generate_latest,
+    Histogram,
+)
+from pydantic import parse_obj_as
+from qdrant_client import AsyncQdrantClient
+from redis.asyncio import ConnectionPool, Redis
+from redis.asyncio.lock import Lock
+from redis.exceptions import LockError
+from sanitizer import sanitize_for_embedding
 from sse_starlette.sse import EventSourceResponse
-from tenacity import retry, stop_after_attempt
-from typing import List, Annotated, Optional, Tuple, Union
-from uuid import uuid4, UUID
+from tenacity import (
+    retry,
+    retry_if_exception,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+from typing import (
+    Annotated,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from uuid import uuid4, uuid5, UUID, NAMESPACE_URL
 from yarl import URL
 import aiohttp
 import asyncio
+import azure.ai.contentsafety as azure_cs
 import azure.core.exceptions as azure_exceptions
-import html
+import itertools
+import json
 import logging
 import mmh3
+import multiprocessing
 import openai
+import orjson
 import os
 import qdrant_client.http.models as qmodels
-import re
+import random
 import textwrap
+import tiktoken
 import time
+import unicodedata
 
 
 ###
@@ -67,10 +110,54 @@ LOGGING_APP_LEVEL = os.environ.get("MS_LOGGING_APP_LEVEL", logging.INFO)
 logger = logging.getLogger(__name__)
 logger.setLevel(LOGGING_APP_LEVEL)
 
+###
+# Init metrics
+###
+
+# Metrics are per worker, as the statistics, there is no aggregation across processes
+METRICS_STAGE_DURATION = Histogram(
+    "moaw_search_stage_duration_seconds",
+    "Duration of the stages of the searches, the suggestions and the indexing",
+    ["stage"],
+)
+METRICS_CACHE_LOOKUPS = Counter(
+    "moaw_search_cache_lookups",
+    "Cache lookups, by cache family and result",
+    ["family", "result"],
+)
+METRICS_SUGGESTION_TTFT = Histogram(
+    "moaw_search_suggestion_time_to_first_token_seconds",
+    "Time from the start of a suggestion stream to its first token",
+)
+METRICS_SUGGESTION_TOKENS_PER_SECOND = Histogram(
+    "moaw_search_suggestion_tokens_per_second",
+    "Streaming speed of the suggestions, from their first token",
+    buckets=(5, 10, 20, 40, 80, 160, 320),
+)
+METRICS_SUGGESTION_PROMPT_TOKENS = Histogram(
+    "moaw_search_suggestion_prompt_tokens",
+    "Tokens of the suggestion prompts",
+    buckets=(256, 512, 1024, 1536, 2048, 2560, 3072, 4096),
+)
+METRICS_SSE_IN_FLIGHT = Gauge(
+    "moaw_search_sse_in_flight",
+    "SSE streams open with clients",
+)
+METRICS_INDEX_WORKSHOPS = Counter(
+    "moaw_search_index_workshops",
+    "Workshops processed by the indexing, by result",
+    ["result"],
+)
+METRICS_INDEX_CHUNKS = Counter(
+    "moaw_search_index_chunks",
+    "Chunks embedded and upserted by the indexing",
+)
+
 ###
 # Init OpenAI
 ###
 
+
 async def refresh_oai_token():
     """
     Refresh OpenAI token every 25 minutes.
@@ -79,28 +166,47 @@ async def refresh_oai_token():
 
     See: https://github.com/openai/openai-python/pull/350#issuecomment-1489813285
     """
-    while True:
-        logger.info("(OpenAI) Refreshing token")
-        oai_cred = DefaultAzureCredential()
-        oai_token = oai_cred.get_token("https://cognitiveservices.azure.com/.default")
-        openai.api_key = oai_token.token
-        # Execute every 25 minutes
-        await asyncio.sleep(25*60)
+    async with DefaultAzureCredential() as oai_cred:
+        while True:
+            logger.info("(OpenAI) Refreshing token")
+            oai_token = await oai_cred.get_token(
+                "https://cognitiveservices.azure.com/.default"
+            )
+            openai.api_key = oai_token.token
+            # Execute every 25 minutes
+            await asyncio.sleep(25 * 60)
 
 
 OAI_EMBEDDING_ARGS = {
     "deployment_id": os.environ.get("MS_OAI_ADA_DEPLOY_ID"),
     "model": "text-embedding-ada-002",
 }
+# Budgets of a batched embedding request
+OAI_EMBEDDING_BATCH_ITEMS = int(os.environ.get("MS_OAI_EMBEDDING_BATCH_ITEMS", 16))
+OAI_EMBEDDING_BATCH_TOKENS = int(os.environ.get("MS_OAI_EMBEDDING_BATCH_TOKENS", 32000))
+# Delay to wait for more texts before sending an incomplete batch
+OAI_EMBEDDING_BATCH_LINGER_SECS = 0.05  # 50 ms
 OAI_COMPLETION_ARGS = {
     "deployment_id": os.environ.get("MS_OAI_GPT_DEPLOY_ID"),
     "model": "gpt-3.5-turbo",
 }
+# Generations running at once per worker, others wait in the queue
+OAI_COMPLETION_CONCURRENCY = int(os.environ.get("MS_OAI_COMPLETION_CONCURRENCY", 8))
+# Generations waiting per worker, beyond it another worker takes over
+OAI_COMPLETION_QUEUE_SIZE = int(os.environ.get("MS_OAI_COMPLETION_QUEUE_SIZE", 32))
+oai_completion_sem = asyncio.Semaphore(OAI_COMPLETION_CONCURRENCY)
+# Tokens of the prompt, with the query, the rest of the context window (4096 tokens) is left to the answer
+OAI_COMPLETION_PROMPT_TOKENS = int(
+    os.environ.get("MS_OAI_COMPLETION_PROMPT_TOKENS", 2560)
+)
+# Workshop descriptions are truncated to this number of tokens in the prompt
+OAI_COMPLETION_DESCRIPTION_TOKENS = int(
+    os.environ.get("MS_OAI_COMPLETION_DESCRIPTION_TOKENS", 256)
+)
 
 logger.info(f"(OpenAI) Using Aure private service ({openai.api_base})")
 openai.api_type = "azure_ad"
 openai.api_version = "2023-05-15"
-asyncio.create_task(refresh_oai_token())
 
 ###
 # Init Azure Content Safety
@@ -112,9 +218,7 @@ ACS_SEVERITY_THRESHOLD = 2
 ACS_API_BASE = os.environ.get("MS_ACS_API_BASE")
 ACS_API_TOKEN = os.environ.get("MS_ACS_API_TOKEN")
 logger.info(f"(Azure Content Safety) Using Aure private service ({ACS_API_BASE})")
-acs_client = azure_cs.ContentSafetyClient(
-    ACS_API_BASE, AzureKeyCredential(ACS_API_TOKEN)
-)
+acs_client = ContentSafetyClient(ACS_API_BASE, AzureKeyCredential(ACS_API_TOKEN))
 
 ###
 # Init FastAPI
@@ -153,19 +257,38 @@ QD_COLLECTION = "moaw"
 QD_DIMENSION = 1536
 QD_METRIC = qmodels.Distance.DOT
 QD_HOST = os.environ.get("MS_QD_HOST")
-qd_client = QdrantClient(host=QD_HOST, port=6333)
-
-# Ensure collection exists
-try:
-    qd_client.get_collection(QD_COLLECTION)
-except Exception:
-    qd_client.create_collection(
-        collection_name=QD_COLLECTION,
-        vectors_config=qmodels.VectorParams(
-            distance=QD_METRIC,
-            size=QD_DIMENSION,
-        ),
-    )
+# Embeddings of the recent queries, for the semantic cache
+QD_COLLECTION_QUERIES = "moaw-queries"
+QD_METRIC_QUERIES = qmodels.Distance.COSINE
+# Queries with a similarity above this threshold share their results and suggestion
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("MS_SEMANTIC_CACHE_THRESHOLD", 0.97))
+qd_client = AsyncQdrantClient(host=QD_HOST, port=6333)
+
+INDEX_FEED_URL = "https://microsoft.github.io/moaw/workshops.json"
+# Concurrency of each indexing stage, shared by all the indexing runs of the worker
+INDEX_SCRAPE_CONCURRENCY = int(os.environ.get("MS_INDEX_SCRAPE_CONCURRENCY", 8))
+INDEX_CLEAN_CONCURRENCY = int(os.environ.get("MS_INDEX_CLEAN_CONCURRENCY", 2))
+INDEX_EMBED_CONCURRENCY = int(os.environ.get("MS_INDEX_EMBED_CONCURRENCY", 4))
+INDEX_UPSERT_BATCH_SIZE = int(os.environ.get("MS_INDEX_UPSERT_BATCH_SIZE", 32))
+# Workshop content is split in overlapping chunks, each one indexed as a point
+INDEX_CHUNK_TOKENS = int(os.environ.get("MS_INDEX_CHUNK_TOKENS", 512))
+INDEX_CHUNK_OVERLAP_TOKENS = int(os.environ.get("MS_INDEX_CHUNK_OVERLAP_TOKENS", 64))
+INDEX_CHUNKS_MAX = int(os.environ.get("MS_INDEX_CHUNKS_MAX", 64))
+# Share of the indexed workshops a run can delete, above it the feed is more likely truncated than pruned
+INDEX_DELETE_MAX_RATIO = float(os.environ.get("MS_INDEX_DELETE_MAX_RATIO", 0.5))
+# Bump to re-index all the workshops when the indexed data changes
+INDEX_VERSION = 2
+# Matches the first chunk of each workshop, to count or list workshops
+INDEX_FIRST_CHUNK_FILTER = qmodels.Filter(
+    must=[qmodels.FieldCondition(key="chunk", match=qmodels.MatchValue(value=0))]
+)
+index_scrape_sem = asyncio.Semaphore(INDEX_SCRAPE_CONCURRENCY)
+index_clean_sem = asyncio.Semaphore(INDEX_CLEAN_CONCURRENCY)
+index_embed_sem = asyncio.Semaphore(INDEX_EMBED_CONCURRENCY)
+# Sanitization is CPU-bound, it runs out of the event loop, in one process per cleaning slot
+index_clean_executor = ProcessPoolExecutor(
+    max_workers=INDEX_CLEAN_CONCURRENCY, mp_context=multiprocessing.get_context("spawn")
+)
 
 ###
 # Init Redis
@@ -173,36 +296,232 @@ except Exception:
 
 GLOBAL_CACHE_TTL_SECS = 60 * 60  # 1 hour
 SUGGESTION_TOKEN_TTL_SECS = 60 * 10  # 10 minutes
+# Suggestions are cached for GLOBAL_CACHE_TTL_SECS per request, up to this duration for popular ones
+SUGGESTION_CACHE_MAX_TTL_SECS = 60 * 60 * 24  # 1 day
+# Searches by query and limit, the most popular ones are pre-warmed after each indexing
+SEARCH_POPULARITY_KEY = "search-popularity"
+SEARCH_POPULARITY_SIZE = 1000
+# Share of the searches trimming the popularity to its size, so it stays bounded between two pre-warms
+SEARCH_POPULARITY_TRIM_RATE = 0.01
+SEARCH_PREWARM_QUERIES = int(os.environ.get("MS_SEARCH_PREWARM_QUERIES", 50))
+# Suggestions are only generated for the most popular queries, to bound the cost of a pre-warm
+SEARCH_PREWARM_SUGGESTIONS = int(os.environ.get("MS_SEARCH_PREWARM_SUGGESTIONS", 10))
+SEARCH_PREWARM_CONCURRENCY = int(os.environ.get("MS_SEARCH_PREWARM_CONCURRENCY", 2))
+# Lease of the suggestion producer, renewed while generating, taken over by a reader after expiration
+SUGGESTION_LEASE_TTL_SECS = 10  # 10 seconds
+# Generations started for the same suggestion, by takeovers or retries, within REDIS_STREAM_TIMEOUT_SECS
+SUGGESTION_ATTEMPTS_MAX = 3
+# Generation without reader is kept for this duration, so a client reconnecting resumes it
+SUGGESTION_RESUME_GRACE_SECS = 5  # 5 seconds
+# SSE event ID of the end of the suggestion, a client reconnecting with it has nothing left to read
+SUGGESTION_END_EVENT_ID = "end"
 REDIS_HOST = os.environ.get("MS_REDIS_HOST")
 REDIS_PORT = 6379
 REDIS_STREAM_STOPWORD = "STOP"
-redis_client_api = Redis(db=0, host=REDIS_HOST, port=REDIS_PORT)
+REDIS_STREAM_RESETWORD = "RESET"
+# Sent instead of the stopword when the generation failed, readers stop without taking over
+REDIS_STREAM_ERRORWORD = "ERROR"
+# Blocking reads are released regularly to detect streams without subscribers anymore
+REDIS_STREAM_BLOCK_MS = 5 * 1000  # 5 seconds
+# A stream without any new message for this duration is considered as dead
+REDIS_STREAM_TIMEOUT_SECS = 60  # 1 minute
+# Streamed tokens are grouped in one message, until one of the bounds is reached
+REDIS_STREAM_BATCH_CHARS = 64
+REDIS_STREAM_BATCH_LINGER_SECS = 0.05  # 50 ms
+# Safety bound, far above the messages of a suggestion, as late readers read the stream from its beginning
+REDIS_STREAM_MAXLEN = 1024
+# Embeddings are deterministic for a given text and model, they can be kept long
+EMBEDDING_CACHE_TTL_SECS = 60 * 60 * 24  # 1 day
+HTTP_VALIDATOR_TTL_SECS = 60 * 60 * 24 * 7  # 7 days
+# Vectors are stored as float32 bytes, 6 KB each for ada-002
+embedding_cache: LruCache[bytes] = LruCache(
+    size=int(os.environ.get("MS_EMBEDDING_CACHE_SIZE", 1000)),
+    ttl=EMBEDDING_CACHE_TTL_SECS,
+)
+# Safe verdicts are stable, flagged ones are kept shorter to not block a false positive for long
+MODERATION_CACHE_SAFE_TTL_SECS = int(
+    os.environ.get("MS_MODERATION_CACHE_SAFE_TTL_SECS", 60 * 60 * 24)  # 1 day
+)
+MODERATION_CACHE_FLAGGED_TTL_SECS = int(
+    os.environ.get("MS_MODERATION_CACHE_FLAGGED_TTL_SECS", 60 * 60)  # 1 hour
+)
+moderation_cache: LruCache[ModerationModel] = LruCache(
+    size=int(os.environ.get("MS_MODERATION_CACHE_SIZE", 1000)),
+    ttl=MODERATION_CACHE_SAFE_TTL_SECS,
+)
+# Context blocks of the workshops in the prompt, with their number of tokens
+prompt_block_cache: LruCache[Tuple[str, int]] = LruCache(
+    size=int(os.environ.get("MS_PROMPT_BLOCK_CACHE_SIZE", 1000)),
+    ttl=60 * 60 * 24,  # 1 day
+)
+# Connection pool is shared by all the requests of the worker, connections are opened lazily
+redis_pool_api = ConnectionPool(db=0, host=REDIS_HOST, port=REDIS_PORT)
+redis_client_api = Redis(connection_pool=redis_pool_api)
+# Decrements a counter only while it is positive, an expired counter is not recreated at -1
+redis_decr_positive = redis_client_api.register_script(
+    """
+    local value = tonumber(redis.call("GET", KEYS[1]))
+    if value and value > 0 then
+        return redis.call("DECR", KEYS[1])
+    end
+    return 0
+    """
+)
+
+###
+# Init lexical index
+###
+
+# Serialized index is shared by the workers, which reload it when notified on the channel
+LEXICAL_INDEX_KEY = "lexical-index"
+LEXICAL_INDEX_CHANNEL = "lexical-index"
+# Updates of the serialized index are serialized across the workers, each one holds it for a read-modify-write
+LEXICAL_INDEX_LOCK_KEY = "lexical-index-lock"
+LEXICAL_INDEX_LOCK_TTL_SECS = 60  # 1 minute
+# Rank constant of the reciprocal rank fusion, as in the original paper
+SEARCH_RRF_K = 60
+# Both retrievers return more candidates than requested, to be fused
+SEARCH_FUSION_CANDIDATES_FACTOR = 2
+# Dense retrieval is skipped if the query embedding is not available in time
+SEARCH_EMBEDDING_TIMEOUT_SECS = float(
+    os.environ.get("MS_SEARCH_EMBEDDING_TIMEOUT_SECS", 2)
+)
+lexical_index = Bm25Index()
+
+###
+# Init collection statistics
+###
+
+# Statistics are computed by each worker, which refreshes them when notified on the channel
+COLLECTION_STATS_CHANNEL = "collection-stats"
+collection_stats = CollectionStatsModel(languages={}, tags={}, total=0)
+
+###
+# Init readiness
+###
+
+# Dependencies are checked in the background, the readiness probe answers with the last results
+READINESS_CHECK_INTERVAL_SECS = int(
+    os.environ.get("MS_READINESS_CHECK_INTERVAL_SECS", 10)
+)
+READINESS_CHECK_TIMEOUT_SECS = 2  # 2 seconds
+# Results older than this are considered as failed, the background checks being stuck
+READINESS_CHECK_STALE_SECS = READINESS_CHECK_INTERVAL_SECS * 3
+readiness_checks: Dict[str, ReadinessStatus] = {}
+readiness_checked_at: Optional[float] = None
 
 ###
 # Init scheduler
 ###
 
 scheduler_client = RedisJobStore(db=1, host=REDIS_HOST, port=REDIS_PORT)
+# Async client on the scheduler database, only used for the readiness checks
+redis_client_scheduler = Redis(db=1, host=REDIS_HOST, port=REDIS_PORT)
+scheduler = AsyncIOScheduler(
+    jobstores={"redis": scheduler_client},
+    timezone="UTC",
+)
+
+###
+# Init lifecycle
+###
+
+lifecycle_tasks: List[asyncio.Task] = []
 
 
 @api.on_event("startup")
 async def startup_event() -> None:
     """
-    Starts the scheduler, which runs every hour to index the data in the database.
+    Initializes the I/O clients, the OpenAI token refresh, the lexical index, the collection statistics, the readiness checks, and starts the scheduler, which runs every hour to index the data in the database.
     """
-    scheduler = AsyncIOScheduler(
-        jobstores={"redis": scheduler_client},
-        timezone="UTC",
+    lifecycle_tasks.append(asyncio.create_task(refresh_oai_token()))
+
+    # Ensure collections exist
+    for collection, metric in [
+        (QD_COLLECTION, QD_METRIC),
+        (QD_COLLECTION_QUERIES, QD_METRIC_QUERIES),
+    ]:
+        try:
+            await qd_client.get_collection(collection)
+        except Exception:
+            await qd_client.create_collection(
+                collection_name=collection,
+                vectors_config=qmodels.VectorParams(
+                    distance=metric,
+                    size=QD_DIMENSION,
+                ),
+            )
+
+    # Chunks are grouped by workshop at search time, and filtered by index at indexing time
+    for field, schema in [
+        ("chunk", qmodels.PayloadSchemaType.INTEGER),
+        ("workshop_id", qmodels.PayloadSchemaType.KEYWORD),
+    ]:
+        await qd_client.create_payload_index(
+            collection_name=QD_COLLECTION,
+            field_name=field,
+            field_schema=schema,
+        )
+
+    # Collections exist, they can be read
+    await lexical_index_load()
+    await collection_stats_refresh()
+    lifecycle_tasks.append(
+        asyncio.create_task(
+            pubsub_watch(
+                {
+                    COLLECTION_STATS_CHANNEL: collection_stats_refresh,
+                    LEXICAL_INDEX_CHANNEL: lexical_index_load,
+                }
+            )
+        )
     )
+    lifecycle_tasks.append(asyncio.create_task(readiness_watch()))
+
+    scheduler_jobs_add()
+    scheduler.start()
+
+
+def scheduler_jobs_add() -> None:
+    """
+    Adds the periodic jobs to the scheduler, replacing the ones stored by a previous start.
+
+    Arguments of the jobs are passed as keywords, the scheduler calls them with func(*args, **kwargs).
+    """
     scheduler.add_job(
-        args={"user": uuid4()},
         func=index_engine,
         id="index",
         jobstore="redis",
+        kwargs={"user": uuid4()},
         replace_existing=True,
         trigger=CronTrigger(hour="*"),  # Every hour
     )
-    scheduler.start()
+    scheduler.add_job(
+        func=semantic_cache_prune,
+        id="semantic_cache_prune",
+        jobstore="redis",
+        replace_existing=True,
+        trigger=CronTrigger(hour="*"),  # Every hour
+    )
+
+
+@api.on_event("shutdown")
+async def shutdown_event() -> None:
+    """
+    Stops the scheduler, the background tasks and the sanitization processes, then closes the I/O clients.
+    """
+    scheduler.shutdown(wait=False)
+    index_clean_executor.shutdown(wait=False, cancel_futures=True)
+
+    for task in lifecycle_tasks:
+        task.cancel()
+    await asyncio.gather(*lifecycle_tasks, return_exceptions=True)
+
+    await acs_client.close()
+    await qd_client.close()
+    await redis_client_api.close()
+    await redis_pool_api.disconnect()
+    await redis_client_scheduler.close()
 
 
 @api.get(
@@ -217,74 +536,28 @@ async def health_liveness_get() -> None:
 @api.get(
     "/health/readiness",
     name="Healthckeck readiness",
+    description=f"Dependencies are checked every {READINESS_CHECK_INTERVAL_SECS} seconds in the background, with read-only calls, the last results are returned. With deep, dependencies are checked during the request, also writing to the caches.",
 )
-async def health_readiness_get() -> ReadinessModel:
-    # Test the scheduler cache with a transaction (insert, read, delete)
-    cache_scheduler_check = ReadinessStatus.FAIL
-    try:
-        key = str(uuid4())
-        value = "test"
-        scheduler_client.redis.set(key, value)
-        assert value == scheduler_client.redis.get(key).decode("utf-8")
-        scheduler_client.redis.delete(key)
-        assert None == scheduler_client.redis.get(key)
-        cache_scheduler_check = ReadinessStatus.OK
-    except Exception:
-        logger.exception(
-            "Error connecting to the scheduler cache database", exc_info=True
-        )
-
-    # Test the database cache with a transaction (insert, read, delete)
-    cache_database_check = ReadinessStatus.FAIL
-    try:
-        key = str(uuid4())
-        value = "test"
-        redis_client_api.set(key, value)
-        assert value == redis_client_api.get(key).decode("utf-8")
-        redis_client_api.delete(key)
-        assert None == redis_client_api.get(key)
-        cache_database_check = ReadinessStatus.OK
-    except Exception:
-        logger.exception(
-            "Error connecting to the database cache database", exc_info=True
-        )
-
-    # Test database with a transaction (insert, read, delete)
-    database_check = ReadinessStatus.FAIL
-    try:
-        identifier = str(uuid4())
-        payload = {"test": "test"}
-        vector = [0.0] * QD_DIMENSION
-        qd_client.upsert(
-            collection_name=QD_COLLECTION,
-            points=qmodels.Batch(
-                ids=[identifier],
-                payloads=[payload],
-                vectors=[vector],
-            ),
-        )
-        assert (
-            "test"
-            == qd_client.retrieve(collection_name=QD_COLLECTION, ids=[identifier])[
-                0
-            ].payload["test"]
-        )
-        qd_client.delete(collection_name=QD_COLLECTION, points_selector=[identifier])
-        try:
-            qd_client.retrieve(collection_name=QD_COLLECTION, ids=[identifier])[0]
-        except IndexError:
-            database_check = ReadinessStatus.OK
-    except Exception:
-        logger.exception("Error connecting to the database", exc_info=True)
+async def health_readiness_get(deep: bool = False) -> ReadinessModel:
+    if deep:
+        checks = await readiness_refresh(deep=True)
+        startup_check = ReadinessStatus.OK
+    else:
+        checks = readiness_checks
+        startup_check = ReadinessStatus.FAIL
+        if (
+            readiness_checked_at is not None
+            and time.monotonic() - readiness_checked_at < READINESS_CHECK_STALE_SECS
+        ):
+            startup_check = ReadinessStatus.OK
 
     readiness = ReadinessModel(
         status=ReadinessStatus.OK,
         checks=[
-            ReadinessCheckModel(id="cache_database", status=cache_database_check),
-            ReadinessCheckModel(id="cache_scheduler", status=cache_scheduler_check),
-            ReadinessCheckModel(id="database", status=database_check),
-            ReadinessCheckModel(id="startup", status=ReadinessStatus.OK),
-        ],
+            ReadinessCheckModel(id=id, status=checks.get(id, ReadinessStatus.FAIL))
+            for id in ("cache_database", "cache_scheduler", "database")
+        ]
+        + [ReadinessCheckModel(id="startup", status=startup_check)],
     )
 
     for check in readiness.checks:
@@ -295,32 +568,213 @@ async def health_readiness_get() -> ReadinessModel:
     return readiness
 
 
-async def search_answer(query: str, limit: int, user: UUID) -> List[any]:
-    vector = await vector_from_text(
+async def readiness_watch() -> None:
+    """
+    Checks the dependencies periodically, and stores the results for the readiness probe.
+    """
+    global readiness_checks, readiness_checked_at
+
+    while True:
+        readiness_checks = await readiness_refresh()
+        readiness_checked_at = time.monotonic()
+        await asyncio.sleep(READINESS_CHECK_INTERVAL_SECS)
+
+
+async def readiness_refresh(deep: bool = False) -> Dict[str, ReadinessStatus]:
+    """
+    Checks the dependencies concurrently, and returns their status by ID.
+
+    Checks are read-only: a ping of the Redis databases and the status of the Qdrant collection. Deep checks also write, read and delete a key in the Redis databases, and read a point from the Qdrant collection. Nothing is written to Qdrant.
+    """
+    checks = {
+        "cache_database": readiness_redis(redis_client_api, deep),
+        "cache_scheduler": readiness_redis(redis_client_scheduler, deep),
+        "database": readiness_qdrant(deep),
+    }
+    statuses = await asyncio.gather(
+        *[readiness_check(id, check) for id, check in checks.items()]
+    )
+    return dict(zip(checks.keys(), statuses))
+
+
+async def readiness_check(id: str, check: Awaitable[None]) -> ReadinessStatus:
+    """
+    Returns the status of a dependency check, failed if it raises or times out.
+    """
+    try:
+        await asyncio.wait_for(check, READINESS_CHECK_TIMEOUT_SECS)
+        return ReadinessStatus.OK
+    except Exception:
+        logger.exception(f"Readiness check {id} failed", exc_info=True)
+        return ReadinessStatus.FAIL
+
+
+async def readiness_redis(client: Redis, deep: bool) -> None:
+    """
+    Checks a Redis database with a ping, or with a transaction (insert, read, delete) if deep.
+    """
+    assert await client.ping()
+    if not deep:
+        return
+
+    key = f"readiness:{uuid4()}"
+    value = "test"
+    await client.set(key, value, ex=READINESS_CHECK_TIMEOUT_SECS)
+    assert value == (await client.get(key)).decode("utf-8")
+    await client.delete(key)
+    assert None == await client.get(key)
+
+
+async def readiness_qdrant(deep: bool) -> None:
+    """
+    Checks the Qdrant collection is available, and if deep, that a point can be read.
+    """
+    collection = await qd_client.get_collection(QD_COLLECTION)
+    assert collection.status != qmodels.CollectionStatus.RED
+    if not deep:
+        return
+
+    await qd_client.scroll(
+        collection_name=QD_COLLECTION,
+        limit=1,
+        with_payload=False,
+        with_vectors=False,
+    )
+
+
+@api.get(
+    "/metrics",
+    name="Get Prometheus metrics",
+    description="Latency of each stage, cache lookups, suggestion streaming and indexing throughput, in the Prometheus text format. Metrics are per worker, since its start.",
+)
+async def metrics_get() -> Response:
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@api.get(
+    "/stats/caches",
+    name="Get cache statistics",
+    description="Hit ratio and average latency (in seconds) of the caches, by family. Statistics are per worker, since its start.",
+)
+async def stats_caches_get() -> Dict[str, CacheStatsModel]:
+    return cache_stats
+
+
+@api.get(
+    "/stats",
+    name="Get collection statistics",
+    description="Number of indexed workshops, in total, by language and by tag. Statistics are refreshed after each indexing.",
+)
+async def stats_get() -> CollectionStatsModel:
+    return collection_stats
+
+
+async def vector_from_query(query: str, user: UUID) -> List[float]:
+    """
+    Returns the embedding of a search query.
+
+    The embedded text only depends on the normalized query, so the embedding cache is shared by all the variants of the query.
+    """
+    return await vector_from_text(
         textwrap.dedent(
             f"""
-            Today, we are the {datetime.now()}.
-
             QUERY START
-            {query}
+            {query_normalize(query)}
             QUERY END
         """
         ),
         user,
     )
 
-    if not vector:
-        return []
+
+async def search_answer(
+    query: str, vector: List[float], limit: int
+) -> List[SearchAnswerModel]:
+    """
+    Returns the most relevant workshops, from both the lexical and the dense retrievers.
+
+    Rankings are combined with the reciprocal rank fusion, scores are normalized so a workshop ranked first by all the retrievers which found something scores 1. Without vector, only the lexical index is used.
+    """
+    candidates = limit * SEARCH_FUSION_CANDIDATES_FACTOR
+    rankings: List[List[str]] = []
+    payloads: Dict[str, dict] = {}
+
+    with METRICS_STAGE_DURATION.labels(stage="lexical_search").time():
+        lexical_hits = lexical_index.search(query, candidates)
+    rankings.append([doc_id for doc_id, _ in lexical_hits])
+
+    if vector:
+        with METRICS_STAGE_DURATION.labels(stage="vector_search").time():
+            hits = await search_dense(vector, candidates)
+        rankings.append([hit.payload["workshop_id"] for hit in hits])
+        payloads.update({hit.payload["workshop_id"]: hit.payload for hit in hits})
+
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, workshop_id in enumerate(ranking):
+            scores[workshop_id] = scores.get(workshop_id, 0) + 1 / (
+                SEARCH_RRF_K + rank + 1
+            )
+    # Empty rankings are not counted, they would cap the scores of the others
+    score_max = max(1, sum(1 for ranking in rankings if ranking)) / (SEARCH_RRF_K + 1)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+    # Workshops only found by the lexical index are fetched from their first chunk
+    missing = [workshop_id for workshop_id, _ in ranked if workshop_id not in payloads]
+    if missing:
+        with METRICS_STAGE_DURATION.labels(stage="payload_fetch").time():
+            records = await qd_client.retrieve(
+                collection_name=QD_COLLECTION,
+                ids=[chunk_id(workshop_id, 0) for workshop_id in missing],
+                with_vectors=False,
+            )
+        payloads.update(
+            {
+                record.payload.get("workshop_id", str(record.id)): record.payload
+                for record in records
+            }
+        )
+
+    answers = []
+    with METRICS_STAGE_DURATION.labels(stage="parsing").time():
+        for workshop_id, score in ranked:
+            payload = payloads.get(workshop_id)
+            if not payload:
+                logger.warning(f"Workshop {workshop_id} is not in the database anymore")
+                continue
+            try:
+                answers.append(
+                    SearchAnswerModel(
+                        id=workshop_id,
+                        metadata=MetadataModel(**payload),
+                        score=score / score_max,
+                    )
+                )
+            except TypeError:
+                logger.exception(f"Error parsing model: {workshop_id}", exc_info=True)
+
+    return answers
+
+
+async def search_dense(vector: List[float], limit: int) -> List[qmodels.ScoredPoint]:
+    """
+    Returns the best chunk of the most similar workshops.
+
+    Chunks are grouped by workshop by Qdrant, using the payload index of the workshop ID.
+    """
 
     search_params = qmodels.SearchParams(hnsw_ef=128, exact=False)
 
     # Get query answer
-    results = qd_client.search(
+    groups = await qd_client.search_groups(
         collection_name=QD_COLLECTION,
+        group_by="workshop_id",
+        group_size=1,
         limit=limit,
         query_vector=vector,
         search_params=search_params,
     )
+    results = [group.hits[0] for group in groups.groups]
     logger.debug(f"Found {len(results)} results")
 
     return results
@@ -329,266 +783,1744 @@ async def search_answer(query: str, limit: int, user: UUID) -> List[any]:
 @api.get(
     "/suggestion/{token}",
     name="Get suggestion from a search",
-    description=f"Token is cached for {SUGGESTION_TOKEN_TTL_SECS}. Suggestions are cached for {GLOBAL_CACHE_TTL_SECS} seconds. User is anonymized.",
+    description=f"Token is cached for {SUGGESTION_TOKEN_TTL_SECS}. Suggestions are cached for {GLOBAL_CACHE_TTL_SECS} seconds per request, up to {SUGGESTION_CACHE_MAX_TTL_SECS} seconds, until one of their workshops is indexed again. Reconnections with the Last-Event-ID header resume the suggestion, the end of the suggestion is sent as the end event. If the suggestion was already read until its end, the API will return a HTTP 204 with no content. User is anonymized.",
 )
-async def suggestion(token: str, user: UUID, req: Request) -> EventSourceResponse:
-    token_key = await token_cache_key(str(token))
-
-    search_raw = redis_client_api.get(token_key)
-    if not search_raw:
+async def suggestion(
+    token: str,
+    user: UUID,
+    req: Request,
+    last_event_id: Annotated[Optional[str], Header()] = None,
+) -> EventSourceResponse:
+    if last_event_id == SUGGESTION_END_EVENT_ID:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    search = await search_from_token(token)
+    if not search:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Suggestion not found or expired",
         )
 
-    search = SearchModel.parse_raw(search_raw)
-    return EventSourceResponse(suggestion_sse_generator(req, search, user))
+    return EventSourceResponse(
+        sse_tracked(suggestion_sse_generator(req, search, user, last_event_id))
+    )
 
 
-async def suggestion_sse_generator(req: Request, search: SearchModel, user: UUID):
+async def suggestion_sse_generator(
+    req: Optional[Request],
+    search: SearchModel,
+    user: UUID,
+    last_event_id: Optional[str] = None,
+):
     """
-    SSE (Server Sent Event) generator for suggestion. It will return the suggestion as soon as it is available.
+    SSE (Server Sent Event) generator for suggestion. It will return the suggestion as soon as it is available. Without req, the suggestion is read for the cache pre-warm.
+
+    Messages are pushed by the stream reader of the worker, there is no polling of Redis per client. Generation is single-flight: concurrent requests for the same query share one completion stream, produced by the holder of the lease. If the producer dies, its lease expires and one of the readers takes over.
+
+    Events carry the ID of the last stream message they contain. With last_event_id, the stream is resumed after it; if it is not in the stream anymore, the client is asked to reset and the stream is read from its beginning.
     """
     logger.debug(f"Starting SSE for suggestion {search.query} for user {user}")
 
-    message_id = 0
+    start = time.monotonic()
+    first_token_at = None
+    first_message = ""
     message_full = ""
-    suggestion_key_req = await suggestion_cache_key(search.suggestion_token)
-    suggestion_key_static = await suggestion_cache_key(search.query)
+    fingerprint = suggestion_fingerprint(search)
+    suggestion_key = await suggestion_cache_key(fingerprint)
+    stream_key = await suggestion_stream_key(fingerprint)
+    readers_key = await suggestion_readers_key(fingerprint)
+    lease = redis_client_api.lock(
+        await suggestion_lease_key(fingerprint),
+        blocking=False,
+        timeout=SUGGESTION_LEASE_TTL_SECS,
+    )
 
     # Test if the cache key exists
-    if redis_client_api.exists(suggestion_key_static):
-        message = redis_client_api.get(suggestion_key_static).decode("utf-8")
-        logger.debug(f"Cache key {suggestion_key_static} exists")
-        yield message
+    message = await suggestion_cache_get(fingerprint)
+    if message:
+        logger.debug(f"Cache key {suggestion_key} exists")
+        if last_event_id:
+            yield {"event": "reset", "data": ""}
+        yield message.decode("utf-8")
+        yield {"event": "end", "data": "", "id": SUGGESTION_END_EVENT_ID}
         return
 
-    # Execute the suggestion
-    completion = asyncio.get_running_loop().run_in_executor(
-        None, lambda: completion_from_text(search, suggestion_key_req, user)
-    )
+    resume_id = (0, 0)
+    if last_event_id:
+        resume_id = await stream_resume_id(stream_key, last_event_id)
+        if resume_id == (0, 0):
+            logger.debug(f"Cannot resume suggestion stream {stream_key}, restarting")
+            yield {"event": "reset", "data": ""}
+
+    # Register as a reader, the producer stops if there is none left
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        pipe.incr(readers_key)
+        pipe.expire(readers_key, REDIS_STREAM_TIMEOUT_SECS)
+        await pipe.execute()
+
+    try:
+        await suggestion_flight_acquire(search, lease, user)
+        silence = 0
+
+        async for messages in stream_listen(
+            stream_key, SUGGESTION_LEASE_TTL_SECS, resume_id
+        ):
+            if not messages:
+                silence += SUGGESTION_LEASE_TTL_SECS
+                if silence >= REDIS_STREAM_TIMEOUT_SECS:
+                    logger.warning(f"Suggestion stream {stream_key} is stuck, closing")
+                    return
+
+                # Answer has been completed by a producer we missed the end of
+                message = await redis_client_api.get(suggestion_key)
+                if message:
+                    yield {"event": "reset", "data": ""}
+                    yield message.decode("utf-8")
+                    yield {"event": "end", "data": "", "id": SUGGESTION_END_EVENT_ID}
+                    return
+
+                # Heartbeat, the registration outlives a silent producer
+                await redis_client_api.expire(readers_key, REDIS_STREAM_TIMEOUT_SECS)
+                # Producer may have died, try to take over its lease
+                await suggestion_flight_acquire(search, lease, user)
+                continue
+
+            silence = 0
+            message_loop = ""
+            for message_id, message in messages:
+                # Generation restarted, the client drops what it received
+                if message == REDIS_STREAM_RESETWORD:
+                    logger.debug(f"Suggestion stream {stream_key} restarted")
+                    message_full = ""
+                    message_loop = ""
+                    yield {"event": "reset", "data": "", "id": message_id}
+                    continue
+                # Generation failed, the partial answer is dropped
+                if message == REDIS_STREAM_ERRORWORD:
+                    logger.warning(f"Suggestion stream {stream_key} failed, closing")
+                    yield {"event": "reset", "data": ""}
+                    yield {"event": "end", "data": "", "id": SUGGESTION_END_EVENT_ID}
+                    return
+                message_loop += message
+
+            if not message_loop:
+                continue
+
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+                first_message = message_loop
+                METRICS_SUGGESTION_TTFT.observe(first_token_at - start)
+                logger.debug(
+                    f"Time to first token for suggestion {search.query}: {first_token_at - start:.3f}s"
+                )
+            message_full += message_loop
+            # Send all the messages received since the last push at once
+            logger.debug(f"Sending message: {message_loop}")
+            yield {"data": message_loop, "id": message_id}
+
+        # Speed is measured on the tokens received after the first ones
+        if first_token_at is not None and message_full != first_message:
+            METRICS_SUGGESTION_TOKENS_PER_SECOND.observe(
+                (tokens_count(message_full) - tokens_count(first_message))
+                / (time.monotonic() - first_token_at)
+            )
 
-    def client_disconnect():
+        # Stream is complete, clients reconnecting with this ID have nothing left to read
+        yield {"event": "end", "data": "", "id": SUGGESTION_END_EVENT_ID}
+
+    # If client closes connection, the SSE library cancels the generator
+    except asyncio.CancelledError as e:
         logger.info(
-            f"Disconnected from client (via refresh/close) (req={req.client}, user={user})"
+            f"Disconnected from client (via refresh/close) (req={req and req.client}, user={user})"
         )
-        # Cancelling suggestion generation
-        logger.debug("Cancelling suggestion generation")
-        completion.cancel()
-        # Delete the temporary cache key
-        logger.debug("Deleting temporary cache key")
-        redis_client_api.delete(suggestion_key_req)
+        raise e
 
-    try:
-        is_end = False
+    finally:
+        # The producer stops if there is no reader left after the grace period
+        await redis_decr_positive(keys=[readers_key], client=redis_client_api)
 
-        while True:
-            # If client closes connection, stop sending events
-            if await req.is_disconnected():
-                client_disconnect()
-                break
 
-            if is_end:
-                break
+# Producers of the worker, by stream key
+suggestion_producers: Dict[str, asyncio.Task] = {}
 
-            # Read the redis stream with key cache_key
-            messages_raw = redis_client_api.xread(
-                streams={suggestion_key_req: message_id}
-            )
-            message_loop = ""
 
-            if messages_raw:
-                for message_content in messages_raw[0][1]:
-                    message_id = message_content[0]
+async def suggestion_flight_acquire(
+    search: SearchModel, lease: Lock, user: UUID
+) -> None:
+    """
+    Starts the suggestion producer if the lease of the query is free.
 
-                    try:
-                        message = message_content[1][b"message"].decode("utf-8")
-                        if message == REDIS_STREAM_STOPWORD:
-                            is_end = True
-                            break
+    The lease is held by exactly one producer, across all the workers. Other requests for the same query are readers of the stream. Generations are counted per suggestion, past SUGGESTION_ATTEMPTS_MAX the stream is ended with the error word, so failing generations are not restarted forever.
+    """
+    if not await lease.acquire():
+        return
 
-                        message_full += message
-                        message_loop += message
-                    except Exception:
-                        logger.exception("Error decoding message", exc_info=True)
+    # Answer may have been completed between the cache test and the lease acquisition
+    fingerprint = suggestion_fingerprint(search)
+    suggestion_key = await suggestion_cache_key(fingerprint)
+    if await redis_client_api.exists(suggestion_key):
+        await lease.release()
+        return
 
-                # Send the message to the client after the loop
-                if message_loop:
-                    logger.debug(f"Sending message: {message_loop}")
-                    yield message_loop
+    # Admission control, the lease is released so a less loaded worker takes over
+    if (
+        len(suggestion_producers)
+        >= OAI_COMPLETION_CONCURRENCY + OAI_COMPLETION_QUEUE_SIZE
+    ):
+        logger.warning(
+            f"Too many suggestions in progress, leaving {search.query} to another worker"
+        )
+        await lease.release()
+        return
 
-            await asyncio.sleep(0.25)
+    stream_key = await suggestion_stream_key(fingerprint)
+    attempts_key = await suggestion_attempts_key(fingerprint)
+    attempts = await redis_client_api.incr(attempts_key)
+    if attempts == 1:
+        await redis_client_api.expire(attempts_key, REDIS_STREAM_TIMEOUT_SECS)
+    if attempts > SUGGESTION_ATTEMPTS_MAX:
+        logger.error(
+            f"Suggestion {search.query} failed {attempts - 1} times, giving up"
+        )
+        try:
+            await stream_add(stream_key, [REDIS_STREAM_ERRORWORD])
+            await redis_client_api.expire(stream_key, REDIS_STREAM_TIMEOUT_SECS)
+        finally:
+            await lease.release()
+        return
 
-    except asyncio.CancelledError as e:
-        client_disconnect()
-        raise e
+    # Previous attempt has ended, the readers of the new one must not read its end
+    last = await redis_client_api.xrevrange(stream_key, count=1)
+    if last and last[0][1].get(b"message", b"").decode("utf-8") in (
+        REDIS_STREAM_STOPWORD,
+        REDIS_STREAM_ERRORWORD,
+    ):
+        await redis_client_api.delete(stream_key)
 
-    # Delete the temporary cache key
-    logger.debug(f"Deleting temporary cache key {suggestion_key_req}")
-    redis_client_api.delete(suggestion_key_req)
-    # Store the full message in the cache
-    logger.debug(f"Storing full message in cache key {suggestion_key_static}")
-    redis_client_api.set(suggestion_key_static, message_full, ex=GLOBAL_CACHE_TTL_SECS)
+    logger.info(f"Acquired suggestion lease for {search.query}, producing")
+    task = asyncio.create_task(suggestion_produce(search, lease, user))
+    # Keep a reference to the task, so it is not garbage collected before its end
+    suggestion_producers[stream_key] = task
+    task.add_done_callback(lambda _: suggestion_producers.pop(stream_key, None))
 
 
-@api.get(
-    "/search",
-    name="Get search results",
-    description=f"Search results are cached for {GLOBAL_CACHE_TTL_SECS} seconds. Suggestion tokens are cached for {GLOBAL_CACHE_TTL_SECS} seconds. If the input is moderated, the API will return a HTTP 204 with no content. User is anonymized.",
-)
-async def search(
-    query: Annotated[str, Query(max_length=200)], user: UUID, limit: int = 10
-) -> Union[SearchModel, None]:
-    start = time.monotonic()
+async def suggestion_produce(search: SearchModel, lease: Lock, user: UUID) -> None:
+    """
+    Produces the suggestion stream while holding the lease, then caches the full answer.
 
-    logger.info(f"Searching for text: {query}")
+    The lease is renewed periodically, also while waiting for a generation slot. Generation is cancelled if the lease is lost, or if there is no reader left for the grace period, during which a reconnecting client can resume it. If the generation does not end with the stopword, it is ended with the error word.
+    """
+    fingerprint = suggestion_fingerprint(search)
+    suggestion_key = await suggestion_cache_key(fingerprint)
+    stream_key = await suggestion_stream_key(fingerprint)
+    readers_key = await suggestion_readers_key(fingerprint)
+    # Stream is ended by the stopword, or left to another producer, or deleted
+    ended = False
 
-    search_cache_key = f"search:{query}-{limit}"
+    completion = asyncio.create_task(completion_admitted(search, stream_key, user))
+    abandoned_at = None
 
-    suggestion_cached = redis_client_api.get(search_cache_key)
-    if suggestion_cached:
-        search = SearchModel.parse_raw(suggestion_cached)
-        answers = search.answers
-        total = search.stats.total
-        logger.debug("Found cached results")
+    try:
+        while True:
+            done, _ = await asyncio.wait(
+                {completion}, timeout=SUGGESTION_LEASE_TTL_SECS / 3
+            )
+            if done:
+                break
 
-    else:
-        logger.debug("No cached results found")
+            readers = int(await redis_client_api.get(readers_key) or 0)
+            if readers > 0:
+                abandoned_at = None
+            elif abandoned_at is None:
+                abandoned_at = time.monotonic()
+            elif time.monotonic() - abandoned_at >= SUGGESTION_RESUME_GRACE_SECS:
+                logger.info(f"No reader left for suggestion {search.query}, cancelling")
+                completion.cancel()
+                ended = True
+                await redis_client_api.delete(stream_key)
+                return
 
-        if await is_moderated(query):
-            logger.debug(f"Query is moderated: {query}")
-            return Response(status_code=status.HTTP_204_NO_CONTENT)
+            try:
+                await lease.reacquire()
+            except LockError:
+                logger.warning(f"Suggestion lease lost for {search.query}, cancelling")
+                completion.cancel()
+                ended = True
+                return
+            async with redis_client_api.pipeline(transaction=False) as pipe:
+                pipe.expire(readers_key, REDIS_STREAM_TIMEOUT_SECS)
+                pipe.expire(stream_key, REDIS_STREAM_TIMEOUT_SECS)
+                await pipe.execute()
+
+        message_full = completion.result()
+        if message_full is None:
+            return
+        ended = True
+
+        # Store the full message in the cache
+        logger.debug(f"Storing full message in cache key {suggestion_key}")
+        async with redis_client_api.pipeline(transaction=False) as pipe:
+            pipe.set(suggestion_key, message_full, ex=GLOBAL_CACHE_TTL_SECS)
+            # Referenced by its workshops, to be invalidated when one of them is indexed again
+            for answer in search.answers:
+                workshop_key = await suggestion_workshop_key(str(answer.id))
+                pipe.sadd(workshop_key, suggestion_key)
+                pipe.expire(workshop_key, SUGGESTION_CACHE_MAX_TTL_SECS)
+            # Late readers still need to read the end of the stream
+            pipe.expire(stream_key, REDIS_STREAM_TIMEOUT_SECS)
+            await pipe.execute()
+
+    except Exception:
+        logger.exception(
+            f"Error producing suggestion for {search.query}", exc_info=True
+        )
 
-        total = qd_client.count(collection_name=QD_COLLECTION, exact=False).count
-        results = await search_answer(query, limit, user)
-        answers = []
-        for res in results:
+    finally:
+        completion.cancel()
+        if not ended:
             try:
-                answers.append(
-                    SearchAnswerModel(
-                        id=res.id,
-                        metadata=MetadataModel(**res.payload),
-                        score=res.score,
-                    )
+                await stream_add(stream_key, [REDIS_STREAM_ERRORWORD])
+            except Exception:
+                logger.exception(
+                    f"Error ending suggestion stream {stream_key}", exc_info=True
                 )
-            except TypeError:
-                logger.exception(f"Error parsing model: {res.id}", exc_info=True)
+        try:
+            await lease.release()
+        except LockError:
+            pass
 
-    search = SearchModel(
-        answers=answers,
-        query=query,
-        stats=SearchStatsModel(time=(time.monotonic() - start), total=total),
-        suggestion_token=uuid4(),
-    )
-    token_key = await token_cache_key(search.suggestion_token)
 
-    redis_client_api.set(search_cache_key, search.json(), ex=GLOBAL_CACHE_TTL_SECS)
-    redis_client_api.set(token_key, search.json(), ex=SUGGESTION_TOKEN_TTL_SECS)
+async def completion_admitted(
+    search: SearchModel, cache_key: str, user: UUID
+) -> Optional[str]:
+    """
+    Runs completion_from_text once a generation slot of the worker is free.
+    """
+    async with oai_completion_sem:
+        return await completion_from_text(search, cache_key, user)
 
-    return search
 
+stream_subscribers: Dict[str, Set[asyncio.Queue]] = {}
+stream_readers: Dict[str, asyncio.Task] = {}
 
-@api.get(
-    "/index",
+
+async def stream_listen(
+    key: str, timeout: float, last_id: Tuple[int, int] = (0, 0)
+) -> AsyncGenerator[List[Tuple[str, str]], None]:
+    """
+    Yields the messages of a Redis stream, with their ID, after last_id, until the stopword or the error word is received. The error word is yielded as the last message. If the stream stays silent for the timeout, an empty list is yielded, so the caller can check the producer health.
+
+    Messages are grouped by what was received since the last iteration. Only one blocking reader is started per stream and per worker, whatever the number of listeners. Listeners joining a running reader catch up with a range read, duplicates are skipped by comparing the message IDs.
+    """
+    queue = asyncio.Queue()
+    stream_subscribers.setdefault(key, set()).add(queue)
+    if key not in stream_readers:
+        stream_readers[key] = asyncio.create_task(stream_reader(key))
+
+    try:
+        # Catch up with the messages sent before the subscription
+        catchup = await redis_client_api.xrange(key)
+        if catchup:
+            queue.put_nowait(catchup)
+
+        while True:
+            try:
+                batch = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                # Reader may have stopped on an error, restart it
+                if key not in stream_readers:
+                    stream_readers[key] = asyncio.create_task(stream_reader(key))
+                yield []
+                continue
+
+            # Drain all the messages already received
+            batches = [batch]
+            while not queue.empty():
+                batches.append(queue.get_nowait())
+
+            messages = []
+            is_end = False
+            for message_id, fields in itertools.chain(*batches):
+                message_id_parsed = stream_id_parse(message_id)
+                if message_id_parsed <= last_id:
+                    continue
+                last_id = message_id_parsed
+
+                try:
+                    message = fields[b"message"].decode("utf-8")
+                except Exception:
+                    logger.exception("Error decoding message", exc_info=True)
+                    continue
+
+                if message == REDIS_STREAM_STOPWORD:
+                    is_end = True
+                    break
+                messages.append((message_id.decode("utf-8"), message))
+                if message == REDIS_STREAM_ERRORWORD:
+                    is_end = True
+                    break
+
+            if messages:
+                yield messages
+            if is_end:
+                return
+
+    finally:
+        subscribers = stream_subscribers.get(key, set())
+        subscribers.discard(queue)
+        # The reader cleans up itself when running, otherwise, do it here
+        if not subscribers and key not in stream_readers:
+            stream_subscribers.pop(key, None)
+
+
+async def stream_resume_id(key: str, last_event_id: str) -> Tuple[int, int]:
+    """
+    Returns the ID to resume a Redis stream after, from the last SSE event ID received by a client.
+
+    If the ID is invalid or not in the stream anymore, the stream has to be read from its beginning, (0, 0) is returned.
+    """
+    try:
+        resume_id = stream_id_parse(last_event_id)
+    except ValueError:
+        return (0, 0)
+
+    if not await redis_client_api.xrange(key, min=last_event_id, max=last_event_id):
+        return (0, 0)
+
+    return resume_id
+
+
+async def stream_reader(key: str) -> None:
+    """
+    Reads a Redis stream with blocking reads and pushes the messages to all the listeners of the worker.
+
+    The reader stops when the stopword or the error word is received, or when there is no listener anymore.
+    """
+    logger.debug(f"Starting stream reader for {key}")
+    last_id = "0-0"
+
+    try:
+        while stream_subscribers.get(key):
+            res = await redis_client_api.xread(
+                block=REDIS_STREAM_BLOCK_MS, streams={key: last_id}
+            )
+            if not res:
+                continue
+
+            messages = res[0][1]
+            last_id = messages[-1][0]
+            for queue in stream_subscribers.get(key, set()):
+                queue.put_nowait(messages)
+
+            if any(
+                fields.get(b"message")
+                in (
+                    REDIS_STREAM_STOPWORD.encode("utf-8"),
+                    REDIS_STREAM_ERRORWORD.encode("utf-8"),
+                )
+                for _, fields in messages
+            ):
+                break
+
+    except Exception:
+        logger.exception(f"Error reading stream {key}", exc_info=True)
+
+    finally:
+        logger.debug(f"Stopping stream reader for {key}")
+        stream_readers.pop(key, None)
+        if not stream_subscribers.get(key):
+            stream_subscribers.pop(key, None)
+
+
+@api.get(
+    "/search",
+    name="Get search results",
+    description=f"Search results are cached for {GLOBAL_CACHE_TTL_SECS} seconds. Suggestion tokens are cached for {GLOBAL_CACHE_TTL_SECS} seconds. If the input is moderated, the API will return a HTTP 204 with no content. User is anonymized.",
+)
+async def search(
+    query: Annotated[str, Query(max_length=200)], user: UUID, limit: int = 10
+) -> Union[SearchModel, None]:
+    start = time.monotonic()
+
+    logger.info(f"Searching for text: {query}")
+
+    cached = await search_from_cache(query, limit, start)
+    if cached:
+        search, _ = cached
+        await search_popularity_record(query, limit)
+        # Serialized directly, FastAPI would validate the response model again
+        return Response(
+            content=search_entry_dumps(search), media_type="application/json"
+        )
+
+    vector_task = await search_start(query, user)
+    if not vector_task:
+        logger.debug(f"Query is moderated: {query}")
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    await search_popularity_record(query, limit)
+    search, _ = await search_from_index(query, limit, start, vector_task)
+    return search
+
+
+@api.get(
+    "/search/stream",
+    name="Stream search results and suggestion",
+    description=f"SSE events are sent in order: a lexical preview of the results (preview, only if not cached), the results (results), the suggestion (default event, reset if restarted), then the end of the stream (end). Reconnections with the Last-Event-ID header resume the suggestion, without the results. Search results are cached for {GLOBAL_CACHE_TTL_SECS} seconds, suggestions for {GLOBAL_CACHE_TTL_SECS} seconds per request, up to {SUGGESTION_CACHE_MAX_TTL_SECS} seconds, until one of their workshops is indexed again. If the input is moderated, or if the stream was already read until its end, the API will return a HTTP 204 with no content. User is anonymized.",
+)
+async def search_stream(
+    query: Annotated[str, Query(max_length=200)],
+    user: UUID,
+    req: Request,
+    limit: int = 10,
+    last_event_id: Annotated[Optional[str], Header()] = None,
+) -> EventSourceResponse:
+    if last_event_id == SUGGESTION_END_EVENT_ID:
+        return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    start = time.monotonic()
+
+    logger.info(f"Streaming search for text: {query}")
+
+    cached = await search_from_cache(query, limit, start)
+
+    # Moderation is checked before the stream is opened, to answer with a HTTP 204
+    vector_task = None
+    if not cached:
+        vector_task = await search_start(query, user)
+        if not vector_task:
+            logger.debug(f"Query is moderated: {query}")
+            return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+    # Reconnections are the same search
+    if not last_event_id:
+        await search_popularity_record(query, limit)
+
+    return EventSourceResponse(
+        sse_tracked(
+            search_sse_generator(
+                req, query, user, limit, start, cached, vector_task, last_event_id
+            )
+        )
+    )
+
+
+async def sse_tracked(generator: AsyncGenerator[Union[dict, str], None]):
+    """
+    Wraps a SSE (Server Sent Event) generator, to count the streams in flight.
+    """
+    METRICS_SSE_IN_FLIGHT.inc()
+    try:
+        async for event in generator:
+            yield event
+    finally:
+        METRICS_SSE_IN_FLIGHT.dec()
+        await generator.aclose()
+
+
+async def search_sse_generator(
+    req: Request,
+    query: str,
+    user: UUID,
+    limit: int,
+    start: float,
+    cached: Optional[Tuple[SearchModel, str]],
+    vector_task: Optional[asyncio.Task],
+    last_event_id: Optional[str],
+):
+    """
+    SSE (Server Sent Event) generator for a search, from the preview to the suggestion.
+
+    The preview is answered from the lexical index of the worker, while the query is embedded. The suggestion is streamed with suggestion_sse_generator. With last_event_id, the client already has the results, only the suggestion is resumed.
+    """
+    if cached:
+        search, suggestion_query = cached
+
+    elif last_event_id:
+        search, suggestion_query = await search_from_index(
+            query, limit, start, vector_task
+        )
+
+    else:
+        # Token is shared by the preview and the results, it is only valid once the results are sent
+        suggestion_token = uuid4()
+        try:
+            preview = SearchModel(
+                answers=await search_answer(query, [], limit),
+                query=query,
+                stats=SearchStatsModel(
+                    time=(time.monotonic() - start), total=collection_stats.total
+                ),
+                suggestion_token=suggestion_token,
+            )
+            yield {"event": "preview", "data": preview.json()}
+        except BaseException:
+            # Client disconnected before the results
+            vector_task.cancel()
+            raise
+        search, suggestion_query = await search_from_index(
+            query, limit, start, vector_task, suggestion_token
+        )
+
+    if not last_event_id:
+        yield {"event": "results", "data": search.json()}
+
+    async for message in suggestion_sse_generator(
+        req, search.copy(update={"query": suggestion_query}), user, last_event_id
+    ):
+        yield message
+
+
+async def search_popularity_record(query: str, limit: int) -> None:
+    """
+    Counts a search of the query with the limit, for the pre-warm of the most popular ones.
+
+    A sample of the searches trims the least popular queries, as unique queries would make it grow without bound.
+    """
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        pipe.zincrby(SEARCH_POPULARITY_KEY, 1, orjson.dumps([query, limit]))
+        if random.random() < SEARCH_POPULARITY_TRIM_RATE:
+            pipe.zremrangebyrank(SEARCH_POPULARITY_KEY, 0, -SEARCH_POPULARITY_SIZE - 1)
+        await pipe.execute()
+
+
+async def search_prewarm(user: UUID) -> None:
+    """
+    Computes again the searches of the most popular queries and their suggestions, so they are not cold after an indexing.
+
+    Previous search entries are stale, they are replaced. Suggestions are only generated for the SEARCH_PREWARM_SUGGESTIONS most popular queries, and shared with the users searching meanwhile. Popularity is halved after each pre-warm, for recent searches to prevail, and only the most popular queries are kept.
+    """
+    start = time.monotonic()
+    members = await redis_client_api.zrevrange(
+        SEARCH_POPULARITY_KEY, 0, SEARCH_PREWARM_QUERIES - 1
+    )
+    if not members:
+        return
+
+    sem = asyncio.Semaphore(SEARCH_PREWARM_CONCURRENCY)
+
+    async def prewarm(rank: int, member: bytes) -> None:
+        query, limit = orjson.loads(member)
+        async with sem:
+            try:
+                vector_task = asyncio.create_task(search_vector(query, user))
+                # Semantic cache is skipped, it would answer with the stale entry of a similar query
+                search, suggestion_query = await search_from_index(
+                    query, limit, time.monotonic(), vector_task, semantic=False
+                )
+                if rank >= SEARCH_PREWARM_SUGGESTIONS:
+                    return
+                async for _ in suggestion_sse_generator(
+                    None, search.copy(update={"query": suggestion_query}), user
+                ):
+                    pass
+            except Exception:
+                logger.exception(f"Error pre-warming search {query}", exc_info=True)
+
+    await asyncio.gather(*[prewarm(i, member) for i, member in enumerate(members)])
+
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        pipe.zunionstore(SEARCH_POPULARITY_KEY, {SEARCH_POPULARITY_KEY: 0.5})
+        pipe.zremrangebyrank(SEARCH_POPULARITY_KEY, 0, -SEARCH_POPULARITY_SIZE - 1)
+        await pipe.execute()
+
+    logger.info(
+        f"Pre-warmed {len(members)} popular searches in {time.monotonic() - start:.2f}s"
+    )
+
+
+async def search_from_cache(
+    query: str, limit: int, start: float
+) -> Optional[Tuple[SearchModel, str]]:
+    """
+    Returns the cached search of the query, with a new suggestion token, and the query of its suggestion.
+    """
+    search_cache_key = f"search:{query}-{limit}"
+
+    with METRICS_STAGE_DURATION.labels(stage="cache_read").time():
+        search_raw = await redis_client_api.get(search_cache_key)
+    if not search_raw:
+        logger.debug("No cached results found")
+        return None
+
+    logger.debug("Found cached results")
+    search_entry = search_entry_loads(search_raw)
+    search = SearchModel.construct(
+        answers=search_entry.answers,
+        query=query,
+        stats=SearchStatsModel(
+            time=(time.monotonic() - start), total=search_entry.stats.total
+        ),
+        suggestion_token=uuid4(),
+    )
+    await search_token_store(search.suggestion_token, search_cache_key)
+
+    cache_stats_record("search", True, search.stats.time)
+    METRICS_STAGE_DURATION.labels(stage="search").observe(search.stats.time)
+
+    return (search, search_entry.query)
+
+
+async def search_start(query: str, user: UUID) -> Optional[asyncio.Task]:
+    """
+    Moderates the query and, speculatively at the same time, starts to embed the query.
+
+    Returns the embedding task, to be passed to search_from_index. If the query is moderated, it is cancelled and None is returned.
+    """
+    vector_task = asyncio.create_task(search_vector(query, user))
+
+    try:
+        with METRICS_STAGE_DURATION.labels(stage="moderation").time():
+            moderated = await is_moderated(query)
+    except BaseException:
+        vector_task.cancel()
+        raise
+
+    if moderated:
+        vector_task.cancel()
+        return None
+
+    return vector_task
+
+
+async def search_vector(query: str, user: UUID) -> List[float]:
+    """
+    Returns the embedding of a search query, or an empty vector if it is not available in time.
+    """
+    try:
+        with METRICS_STAGE_DURATION.labels(stage="embedding").time():
+            return await asyncio.wait_for(
+                vector_from_query(query, user), SEARCH_EMBEDDING_TIMEOUT_SECS
+            )
+    except asyncio.TimeoutError:
+        logger.warning("Query embedding timed out, using lexical search only")
+    except Exception:
+        logger.exception(
+            "Error embedding query, using lexical search only", exc_info=True
+        )
+    return []
+
+
+async def search_from_index(
+    query: str,
+    limit: int,
+    start: float,
+    vector_task: asyncio.Task,
+    suggestion_token: Optional[UUID] = None,
+    semantic: bool = True,
+) -> Tuple[SearchModel, str]:
+    """
+    Returns the search of the query, from the semantic cache or the indexes, and the query of its suggestion.
+
+    The embedding is the one started by search_start, once the query is moderated. The total comes from the collection statistics of the worker. Without semantic, the semantic cache is not read, but still written.
+    """
+    search_cache_key = f"search:{query}-{limit}"
+    # Query used for the suggestion, can be a similar query already answered
+    suggestion_query = query
+    search_similar = None
+
+    total = collection_stats.total
+    vector = await vector_task
+
+    if vector and semantic:
+        with METRICS_STAGE_DURATION.labels(stage="semantic_cache").time():
+            search_similar = await semantic_cache_get(vector, limit)
+
+    if search_similar:
+        answers = search_similar.answers
+        suggestion_query = search_similar.query
+        logger.debug(f"Found similar cached results, from {suggestion_query}")
+
+    else:
+        answers = await search_answer(query, vector, limit)
+
+        if vector:
+            await semantic_cache_set(vector, query, limit, search_cache_key)
+
+    search = SearchModel(
+        answers=answers,
+        query=query,
+        stats=SearchStatsModel(time=(time.monotonic() - start), total=total),
+        suggestion_token=suggestion_token or uuid4(),
+    )
+    # Lexical only results are not cached, to be answered completely next time
+    with METRICS_STAGE_DURATION.labels(stage="cache_write").time():
+        await search_store(
+            search, suggestion_query, search_cache_key if vector else None
+        )
+
+    cache_stats_record("search", False, search.stats.time)
+    METRICS_STAGE_DURATION.labels(stage="search").observe(search.stats.time)
+    cache_stats_record("search_semantic", search_similar is not None, search.stats.time)
+
+    return (search, suggestion_query)
+
+
+async def search_store(
+    search: SearchModel, suggestion_query: str, search_cache_key: Optional[str]
+) -> None:
+    """
+    Stores the search for its suggestion token and, if search_cache_key, for the next searches of the query.
+
+    Cached entries carry the query of the suggestion, to share it with similar queries. If the search is cached, the token only references the cached entry.
+    """
+    search_entry = search.copy(update={"query": suggestion_query})
+    token_key = await token_cache_key(search.suggestion_token)
+
+    if not search_cache_key:
+        await redis_client_api.set(
+            token_key, search_entry_dumps(search_entry), ex=SUGGESTION_TOKEN_TTL_SECS
+        )
+        return
+
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        pipe.set(
+            search_cache_key,
+            search_entry_dumps(search_entry),
+            ex=GLOBAL_CACHE_TTL_SECS,
+        )
+        pipe.set(token_key, search_cache_key, ex=SUGGESTION_TOKEN_TTL_SECS)
+        await pipe.execute()
+
+
+async def search_token_store(token: UUID, search_cache_key: str) -> None:
+    """
+    Stores a suggestion token referencing a cached search entry.
+
+    The cached entry is kept at least as long as the token.
+    """
+    token_key = await token_cache_key(token)
+
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        pipe.expire(search_cache_key, SUGGESTION_TOKEN_TTL_SECS, gt=True)
+        pipe.set(token_key, search_cache_key, ex=SUGGESTION_TOKEN_TTL_SECS)
+        await pipe.execute()
+
+
+async def search_from_token(token: str) -> Optional[SearchModel]:
+    """
+    Returns the search of a suggestion token, if not expired.
+
+    Token entries are either a reference to a cached search entry, or the search entry itself.
+    """
+    start = time.monotonic()
+    search_raw = await redis_client_api.get(await token_cache_key(token))
+
+    # Serialized searches are JSON objects, references are keys
+    if search_raw and not search_raw.startswith(b"{"):
+        search_raw = await redis_client_api.get(search_raw)
+
+    cache_stats_record("token", search_raw is not None, time.monotonic() - start)
+    if not search_raw:
+        return None
+
+    return search_entry_loads(search_raw)
+
+
+def search_entry_dumps(search: SearchModel) -> bytes:
+    """
+    Serializes a search entry, as compact JSON.
+    """
+    return orjson.dumps(search.dict())
+
+
+def search_entry_loads(raw: bytes) -> SearchModel:
+    """
+    Deserializes a search entry, serialized with search_entry_dumps.
+
+    Entries are only written by the API, so they are not validated. Models are constructed directly, only the types not native to JSON are converted.
+    """
+    with METRICS_STAGE_DURATION.labels(stage="parsing").time():
+        data = orjson.loads(raw)
+        return SearchModel.construct(
+            answers=[
+                SearchAnswerModel.construct(
+                    id=UUID(answer["id"]),
+                    metadata=MetadataModel.construct(
+                        **{
+                            **answer["metadata"],
+                            "last_updated": datetime.fromisoformat(
+                                answer["metadata"]["last_updated"]
+                            ),
+                        }
+                    ),
+                    score=answer["score"],
+                )
+                for answer in data["answers"]
+            ],
+            query=data["query"],
+            stats=SearchStatsModel.construct(**data["stats"]),
+            suggestion_token=UUID(data["suggestion_token"]),
+        )
+
+
+async def semantic_cache_get(vector: List[float], limit: int) -> Optional[SearchModel]:
+    """
+    Returns the cached search of a similar query, if any.
+
+    Similar queries are searched in a dedicated collection, then the search is read from the exact cache. Errors are logged and considered as a cache miss.
+    """
+    try:
+        res = await qd_client.search(
+            collection_name=QD_COLLECTION_QUERIES,
+            limit=1,
+            query_filter=qmodels.Filter(
+                must=[
+                    qmodels.FieldCondition(
+                        key="limit", match=qmodels.MatchValue(value=limit)
+                    )
+                ]
+            ),
+            query_vector=vector,
+            score_threshold=SEMANTIC_CACHE_THRESHOLD,
+        )
+        if not res:
+            return None
+
+        # Search may have expired from the cache, while its query is not pruned yet
+        search_raw = await redis_client_api.get(res[0].payload["search_key"])
+        if not search_raw:
+            return None
+
+        logger.debug(f"Semantic cache hit with score {res[0].score}")
+        return search_entry_loads(search_raw)
+
+    except Exception:
+        logger.exception("Error reading the semantic cache", exc_info=True)
+        return None
+
+
+async def semantic_cache_set(
+    vector: List[float], query: str, limit: int, search_key: str
+) -> None:
+    """
+    Stores the query embedding in the semantic cache, with a reference to the cached search.
+    """
+    try:
+        await qd_client.upsert(
+            collection_name=QD_COLLECTION_QUERIES,
+            points=[
+                qmodels.PointStruct(
+                    # Same query is stored only once
+                    id=str(uuid5(NAMESPACE_URL, search_key)),
+                    payload={
+                        "created_at": time.time(),
+                        "limit": limit,
+                        "query": query,
+                        "search_key": search_key,
+                    },
+                    vector=vector,
+                )
+            ],
+        )
+
+    except Exception:
+        logger.exception("Error writing the semantic cache", exc_info=True)
+
+
+async def semantic_cache_prune() -> None:
+    """
+    Deletes the queries older than the search cache from the semantic cache, to keep the collection small.
+    """
+    logger.info("Pruning semantic cache")
+    await qd_client.delete(
+        collection_name=QD_COLLECTION_QUERIES,
+        points_selector=qmodels.FilterSelector(
+            filter=qmodels.Filter(
+                must=[
+                    qmodels.FieldCondition(
+                        key="created_at",
+                        range=qmodels.Range(lt=time.time() - GLOBAL_CACHE_TTL_SECS),
+                    )
+                ]
+            )
+        ),
+    )
+
+
+@api.get(
+    "/index",
     status_code=status.HTTP_202_ACCEPTED,
     name="Index workshops from microsoft.github.io. Task is run in background. User is anonymized.",
 )
-async def index(
-    user: UUID, background_tasks: BackgroundTasks, force: Optional[bool] = None
-) -> None:
-    background_tasks.add_task(index_engine, user, force)
+async def index(
+    user: UUID, background_tasks: BackgroundTasks, force: Optional[bool] = None
+) -> None:
+    background_tasks.add_task(index_engine, user, force)
+
+
+async def index_engine(user: UUID, force: bool = False) -> None:
+    """
+    Indexes the workshops from the MOAW feed.
+
+    Each workshop goes through a pipeline of stages: scrape, clean, embed, then upsert. Workshops are processed concurrently, and each stage has its own concurrency limit, shared by all the indexing runs of the worker, to respect the rate limits of the remote services. Upserts are batched.
+
+    The content of a workshop is split in overlapping chunks, each one embedded and stored as a point, with the workshop ID and the chunk index in its payload.
+
+    The feed and the pages are fetched with conditional requests. If the feed is not modified, nothing is indexed. When forced, unchanged workshops are only indexed if their page is modified.
+
+    Workshops removed from the feed are deleted, unless the feed is empty or most of them are removed at once, which a forced run confirms.
+
+    If the index changed, the most popular searches are pre-warmed.
+    """
+    start = time.monotonic()
+
+    async with aiohttp.ClientSession() as session:
+        # An empty lexical index is rebuilt from the feed, even if not modified
+        feed, _, feed_validator = await http_get(
+            INDEX_FEED_URL, session, conditional=not force and len(lexical_index) > 0
+        )
+        if feed is None:
+            logger.info(
+                f"Workshops feed not modified, skipping indexing ({feed_validator.size} bytes saved)"
+            )
+            return
+        workshops = json.loads(feed)
+
+        batcher = EmbeddingBatcher(user)
+        points: List[qmodels.PointStruct] = []
+        validators: List[HttpValidatorModel] = []
+        # Workshops of the points, in the same order as their validators
+        workshop_ids: List[str] = []
+        lexical_docs: Dict[str, str] = {}
+        failed = 0
+        indexed = 0
+        not_modified = 0
+        not_modified_bytes = 0
+
+        async def points_flush() -> None:
+            nonlocal points, validators, workshop_ids, failed, indexed
+            if not points:
+                return
+            # Swap the batch before awaiting, so other workshops can be added meanwhile
+            batch, points = points, []
+            batch_validators, validators = validators, []
+            batch_ids, workshop_ids = workshop_ids, []
+            try:
+                with METRICS_STAGE_DURATION.labels(stage="index_upsert").time():
+                    await qd_client.upsert(collection_name=QD_COLLECTION, points=batch)
+            except Exception:
+                logger.exception(
+                    f"Error upserting {len(batch_ids)} workshops", exc_info=True
+                )
+                # Workshops are not indexed, they are retried on the next run
+                for identifier in batch_ids:
+                    lexical_docs.pop(identifier, None)
+                failed += len(batch_ids)
+                return
+            METRICS_INDEX_CHUNKS.inc(len(batch))
+            indexed += len(batch_validators)
+            # Pages are considered as known only once indexed, otherwise they are only fetched again
+            try:
+                for validator in batch_validators:
+                    await http_validator_save(validator)
+            except Exception:
+                logger.exception("Error saving the page validators", exc_info=True)
+            logger.debug(
+                f"Upserted {len(batch)} chunks of {len(batch_validators)} workshops"
+            )
+
+        async def index_workshop(workshop: dict, conditional: bool) -> None:
+            nonlocal failed, not_modified, not_modified_bytes
+            identifier = workshop.get("id")
+            metadata = MetadataModel(
+                audience=workshop.get("audience"),
+                authors=workshop.get("authors"),
+                description=workshop.get("description"),
+                language=workshop.get("language"),
+                last_updated=datetime.fromisoformat(workshop.get("lastUpdated")),
+                tags=workshop.get("tags"),
+                title=workshop.get("title"),
+                url=workshop.get("url"),
+            )
+
+            try:
+                async with index_scrape_sem:
+                    logger.info(f"Parsing workshop {metadata.title}...")
+                    with METRICS_STAGE_DURATION.labels(stage="index_scrape").time():
+                        content_raw, url, validator = await workshop_scrapping(
+                            metadata.url, session, conditional
+                        )
+                    if content_raw is None:
+                        logger.info(f'Workshop "{metadata.title}" not modified')
+                        not_modified += 1
+                        not_modified_bytes += validator.size
+                        return
+                    # Update model with the real URL
+                    metadata.url = url.human_repr()
+
+                async with index_clean_sem:
+                    with METRICS_STAGE_DURATION.labels(stage="index_clean").time():
+                        # Description is short, sending it to another process would cost more than sanitizing it
+                        description = sanitize_for_embedding(metadata.description)
+                        content = await asyncio.get_running_loop().run_in_executor(
+                            index_clean_executor, sanitize_for_embedding, content_raw
+                        )
+
+                chunks = text_chunks(content)
+                logger.debug(f"Split in {len(chunks)} chunks")
+
+                # Batches are sent under the embedding semaphore
+                with METRICS_STAGE_DURATION.labels(stage="index_embed").time():
+                    vectors = await asyncio.gather(
+                        *[
+                            batcher.embed(
+                                embedding_text_from_metadata(
+                                    metadata, description, chunk
+                                )
+                            )
+                            for chunk in chunks
+                        ]
+                    )
+
+                if not all(vectors):
+                    failed += 1
+                    return
+
+                # Remove the chunks of the previous indexing not overwritten, if the content shrank
+                await qd_client.delete(
+                    collection_name=QD_COLLECTION,
+                    points_selector=qmodels.FilterSelector(
+                        filter=qmodels.Filter(
+                            must=[
+                                qmodels.FieldCondition(
+                                    key="workshop_id",
+                                    match=qmodels.MatchValue(value=identifier),
+                                ),
+                                qmodels.FieldCondition(
+                                    key="chunk",
+                                    range=qmodels.Range(gte=len(vectors)),
+                                ),
+                            ]
+                        )
+                    ),
+                )
+
+            except Exception:
+                logger.exception(
+                    f'Error indexing workshop "{metadata.title}"', exc_info=True
+                )
+                failed += 1
+                return
+
+            lexical_docs[identifier] = lexical_text_from_metadata(
+                metadata, description, content
+            )
+
+            # Create Qdrant payloads, all the chunks are added at once to be upserted in the same batch
+            content_hash = workshop_hash(workshop)
+            points.extend(
+                [
+                    qmodels.PointStruct(
+                        id=chunk_id(identifier, i),
+                        payload={
+                            **metadata.dict(),
+                            "chunk": i,
+                            "content_hash": content_hash,
+                            "workshop_id": identifier,
+                        },
+                        vector=vector,
+                    )
+                    for i, vector in enumerate(vectors)
+                ]
+            )
+            validators.append(validator)
+            workshop_ids.append(identifier)
+            if len(points) >= INDEX_UPSERT_BATCH_SIZE:
+                await points_flush()
+
+        changed, unchanged, deleted = await index_changes(workshops, force)
+
+        # Workshops missing from the lexical index, if it was lost or never built, are re-indexed
+        lexical_missing = [
+            workshop
+            for workshop in unchanged
+            if workshop.get("id") not in lexical_index
+        ]
+        if lexical_missing:
+            logger.info(
+                f"{len(lexical_missing)} workshops missing from the lexical index"
+            )
+            changed += lexical_missing
+            unchanged = [
+                workshop
+                for workshop in unchanged
+                if workshop.get("id") in lexical_index
+            ]
+
+        if deleted:
+            logger.info(f"Deleting {len(deleted)} workshops removed from the feed")
+            await qd_client.delete(
+                collection_name=QD_COLLECTION,
+                points_selector=qmodels.FilterSelector(
+                    filter=qmodels.Filter(
+                        should=[
+                            qmodels.FieldCondition(
+                                key="workshop_id", match=qmodels.MatchAny(any=deleted)
+                            ),
+                            # Workshops indexed before chunking
+                            qmodels.HasIdCondition(has_id=deleted),
+                        ]
+                    )
+                ),
+            )
+
+        await asyncio.gather(
+            *[index_workshop(workshop, False) for workshop in changed],
+            # Only pages modified since the last indexing are re-indexed
+            *[
+                index_workshop(workshop, True)
+                for workshop in (unchanged if force else [])
+            ],
+        )
+        # Insert into Qdrant the last batch
+        await points_flush()
+
+        if lexical_docs or deleted:
+            await lexical_index_update(lexical_docs, deleted)
+            await suggestion_cache_invalidate([*lexical_docs.keys(), *deleted])
+
+        if indexed or deleted:
+            await redis_client_api.publish(COLLECTION_STATS_CHANNEL, "updated")
+
+        # Feed is considered as known only if all its workshops are indexed, otherwise, next run will retry
+        if failed == 0:
+            await http_validator_save(feed_validator)
+
+        for result, count in [
+            ("deleted", len(deleted)),
+            ("failed", failed),
+            ("indexed", indexed),
+            ("not_modified", not_modified),
+        ]:
+            METRICS_INDEX_WORKSHOPS.labels(result=result).inc(count)
+        METRICS_STAGE_DURATION.labels(stage="index").observe(time.monotonic() - start)
+
+        logger.info(
+            f"Indexed {indexed} workshops out of {len(workshops)} in {time.monotonic() - start:.2f}s, {failed} failed, {not_modified} pages not modified ({not_modified_bytes} bytes and {not_modified} embeddings saved)"
+        )
+
+    # Cached searches are stale, popular ones are computed again before users ask for them
+    if indexed or deleted:
+        await search_prewarm(user)
+
+
+async def lexical_index_load() -> None:
+    """
+    Loads the lexical index from Redis, replacing the one of the worker.
+    """
+    global lexical_index
+
+    raw = await redis_client_api.get(LEXICAL_INDEX_KEY)
+    if not raw:
+        logger.info("No lexical index stored yet")
+        return
+
+    # Deserialization is CPU bound, it would block the event loop
+    lexical_index = await asyncio.to_thread(Bm25Index.loads, raw)
+    logger.info(f"Loaded lexical index of {len(lexical_index)} workshops")
+
+
+async def lexical_index_update(documents: Dict[str, str], deleted: List[str]) -> None:
+    """
+    Applies the changes of an indexing run to the lexical index, then stores it and notifies the workers.
+
+    The stored index is read, modified and written under a lock, to not overwrite the changes of another worker. It is rebuilt and serialized in a thread, not on the event loop.
+    """
+    global lexical_index
+
+    async with redis_client_api.lock(
+        LEXICAL_INDEX_LOCK_KEY,
+        blocking_timeout=LEXICAL_INDEX_LOCK_TTL_SECS,
+        timeout=LEXICAL_INDEX_LOCK_TTL_SECS,
+    ):
+        raw = await redis_client_api.get(LEXICAL_INDEX_KEY)
+        index, raw = await asyncio.to_thread(
+            lexical_index_apply, raw, documents, deleted
+        )
+        await redis_client_api.set(LEXICAL_INDEX_KEY, raw)
+
+    lexical_index = index
+    await redis_client_api.publish(LEXICAL_INDEX_CHANNEL, "updated")
+    logger.info(f"Stored lexical index of {len(index)} workshops ({len(raw)} bytes)")
+
+
+def lexical_index_apply(
+    raw: Optional[bytes], documents: Dict[str, str], deleted: List[str]
+) -> Tuple[Bm25Index, bytes]:
+    """
+    Returns the lexical index with the changes applied, and its serialization.
+
+    Pure function, so it can be run in a thread. The index is a new one, the one searched by the worker is not modified.
+    """
+    index = Bm25Index.loads(raw) if raw else Bm25Index()
+    for doc_id in deleted:
+        index.remove(doc_id)
+    for doc_id, text in documents.items():
+        index.add(doc_id, text)
+    return index, index.dumps()
+
+
+async def collection_stats_refresh() -> None:
+    """
+    Computes the statistics of the collection, replacing the ones of the worker.
+
+    Workshops are read with a single scroll of their first chunk, with only the payload fields needed.
+    """
+    global collection_stats
+
+    languages: Dict[str, int] = {}
+    tags: Dict[str, int] = {}
+    total = 0
+    offset = None
+    while True:
+        records, offset = await qd_client.scroll(
+            collection_name=QD_COLLECTION,
+            limit=256,
+            offset=offset,
+            scroll_filter=INDEX_FIRST_CHUNK_FILTER,
+            with_payload=["language", "tags"],
+            with_vectors=False,
+        )
+        for record in records:
+            total += 1
+            language = record.payload.get("language")
+            if language:
+                languages[language] = languages.get(language, 0) + 1
+            for tag in record.payload.get("tags") or []:
+                tags[tag] = tags.get(tag, 0) + 1
+        if offset is None:
+            break
+
+    collection_stats = CollectionStatsModel(
+        languages=languages,
+        tags=tags,
+        total=total,
+        updated_at=datetime.utcnow(),
+    )
+    logger.info(f"Refreshed collection statistics, {total} workshops")
+
+
+async def pubsub_watch(handlers: Dict[str, Callable[[], Awaitable[None]]]) -> None:
+    """
+    Calls the handler of a channel each time a message is published on it, by any worker.
+
+    The subscription is restored if the connection is lost. Errors of the handlers are logged.
+    """
+    while True:
+        pubsub = redis_client_api.pubsub()
+        try:
+            await pubsub.subscribe(*handlers.keys())
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                try:
+                    await handlers[message["channel"].decode("utf-8")]()
+                except Exception:
+                    logger.exception(
+                        f"Error handling message of {message['channel']}",
+                        exc_info=True,
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Error watching the channels", exc_info=True)
+            await asyncio.sleep(5)
+        finally:
+            await pubsub.close()
+
+
+async def index_changes(
+    workshops: List[dict], force: bool = False
+) -> Tuple[List[dict], List[dict], List[str]]:
+    """
+    Returns the workshops of the feed changed since their indexing, the unchanged ones, and the IDs of the indexed workshops not in the feed anymore.
+
+    Indexed workshops are read with a single scroll of their first chunk, without the vectors. A workshop is indexed if it is new, or if the hash of its feed entry changed. For workshops indexed before the hash was stored, the last update date is compared instead.
+
+    If the feed is empty, or more than INDEX_DELETE_MAX_RATIO of the indexed workshops are missing from it, no workshop is returned as deleted, unless forced.
+    """
+    stored: Dict[str, dict] = {}
+    offset = None
+    while True:
+        records, offset = await qd_client.scroll(
+            collection_name=QD_COLLECTION,
+            limit=256,
+            offset=offset,
+            scroll_filter=qmodels.Filter(
+                should=[
+                    INDEX_FIRST_CHUNK_FILTER,
+                    # Workshops indexed before chunking
+                    qmodels.IsEmptyCondition(
+                        is_empty=qmodels.PayloadField(key="chunk")
+                    ),
+                ]
+            ),
+            with_payload=["content_hash", "last_updated", "workshop_id"],
+            with_vectors=False,
+        )
+        for record in records:
+            stored[str(record.payload.get("workshop_id", record.id))] = record.payload
+        if offset is None:
+            break
+    stored_count = len(stored)
+
+    changed = []
+    unchanged = []
+    for workshop in workshops:
+        payload = stored.pop(str(workshop.get("id")), None)
+
+        if payload is None:
+            changed.append(workshop)
+        elif "content_hash" in payload:
+            if payload["content_hash"] != workshop_hash(workshop):
+                changed.append(workshop)
+            else:
+                unchanged.append(workshop)
+        elif parse_obj_as(datetime, payload.get("last_updated")) != (
+            datetime.fromisoformat(workshop.get("lastUpdated"))
+        ):
+            changed.append(workshop)
+        else:
+            unchanged.append(workshop)
+
+    # Remaining stored workshops are not in the feed anymore
+    deleted = list(stored.keys())
+    if (
+        deleted
+        and not force
+        and (not workshops or len(deleted) > INDEX_DELETE_MAX_RATIO * stored_count)
+    ):
+        logger.error(
+            f"Feed misses {len(deleted)} workshops out of {stored_count} indexed, skipping their deletion, force an indexing to confirm it"
+        )
+        deleted = []
+
+    logger.info(
+        f"{len(changed)} workshops changed, {len(unchanged)} unchanged, {len(deleted)} removed"
+    )
+    return (changed, unchanged, deleted)
+
+
+def workshop_hash(workshop: dict) -> str:
+    """
+    Returns the hash of a workshop entry of the feed, as a hexadecimal string.
+
+    The version of the index is part of the hash, so all the workshops are re-indexed when it changes.
+    """
+    return mmh3.hash_bytes(
+        f"{INDEX_VERSION}:{json.dumps(workshop, sort_keys=True)}".encode("utf-8")
+    ).hex()
+
+
+def chunk_id(workshop_id: str, chunk: int) -> str:
+    """
+    Returns the point ID of a chunk of a workshop.
+
+    The first chunk uses the workshop ID, to overwrite the point of workshops indexed before chunking.
+    """
+    if chunk == 0:
+        return workshop_id
+    return str(uuid5(UUID(workshop_id), str(chunk)))
+
+
+def text_chunks(text: str) -> List[str]:
+    """
+    Splits a text in overlapping chunks, bounded in tokens.
+
+    The number of chunks is capped, to bound the cost of a workshop. An empty text returns a single empty chunk, so the workshop is still indexed by its metadata.
+    """
+    encoding = tiktoken.encoding_for_model(OAI_EMBEDDING_ARGS["model"])
+    tokens = encoding.encode(text, disallowed_special=())
+    step = INDEX_CHUNK_TOKENS - INDEX_CHUNK_OVERLAP_TOKENS
+
+    chunks = []
+    for start in range(0, max(len(tokens) - INDEX_CHUNK_OVERLAP_TOKENS, 1), step):
+        chunks.append(encoding.decode(tokens[start : start + INDEX_CHUNK_TOKENS]))
+        if len(chunks) >= INDEX_CHUNKS_MAX:
+            logger.warning(f"Text truncated to {INDEX_CHUNKS_MAX} chunks")
+            break
+
+    return chunks
+
+
+async def vector_from_text(prompt: str, user: UUID) -> List[float]:
+    """
+    Returns the embedding of a text.
+    """
+    return (await vectors_from_texts([prompt], user))[0]
+
+
+async def vectors_from_texts(
+    texts: List[str], user: UUID, cached: bool = True
+) -> List[List[float]]:
+    """
+    Returns the embeddings of texts, in the same order.
+
+    Embeddings are cached in-process, then in Redis. OpenAI is only called for the texts missing from both, grouped in as few requests as the batch budgets allow.
+
+    Without cached, both caches are skipped. It is used by the indexer, whose texts are unlikely to be embedded again and would evict the query embeddings.
+    """
+    logger.debug(f"Getting vectors for {len(texts)} texts")
+    if not cached:
+        try:
+            vectors: List[List[float]] = []
+            for batch in embedding_batches(texts):
+                vectors += await embeddings_request([texts[i] for i in batch], user)
+            return vectors
+        except openai.error.AuthenticationError as e:
+            logger.exception(e)
+            return [[] for _ in texts]
+
+    start = time.monotonic()
+    cache_keys = [await embedding_cache_key(text) for text in texts]
+    vectors_raw: List[Optional[bytes]] = [
+        embedding_cache.get(key) for key in cache_keys
+    ]
+
+    # Read all the local misses from Redis at once
+    misses = [i for i, raw in enumerate(vectors_raw) if not raw]
+    if misses:
+        for i, raw in zip(
+            misses, await redis_client_api.mget([cache_keys[i] for i in misses])
+        ):
+            if raw:
+                embedding_cache.set(cache_keys[i], raw)
+                vectors_raw[i] = raw
+
+    misses = [i for i, raw in enumerate(vectors_raw) if not raw]
+    if len(misses) < len(texts):
+        cache_stats_record(
+            "embedding", True, time.monotonic() - start, len(texts) - len(misses)
+        )
+    if not misses:
+        return [vector_decode(raw) for raw in vectors_raw]
+
+    vectors: List[Optional[List[float]]] = [None] * len(texts)
+    try:
+        for batch in embedding_batches([texts[i] for i in misses]):
+            batch_misses = [misses[i] for i in batch]
+            batch_vectors = await embeddings_request(
+                [texts[i] for i in batch_misses], user
+            )
+            async with redis_client_api.pipeline(transaction=False) as pipe:
+                for i, vector in zip(batch_misses, batch_vectors):
+                    vectors[i] = vector
+                    vector_raw = vector_encode(vector)
+                    embedding_cache.set(cache_keys[i], vector_raw)
+                    pipe.set(cache_keys[i], vector_raw, ex=EMBEDDING_CACHE_TTL_SECS)
+                await pipe.execute()
+    except openai.error.AuthenticationError as e:
+        logger.exception(e)
+        return [[] for _ in texts]
+
+    cache_stats_record("embedding", False, time.monotonic() - start, len(misses))
+
+    return [
+        vectors[i] if vectors[i] is not None else vector_decode(vectors_raw[i])
+        for i in range(len(texts))
+    ]
+
+
+def embedding_batches(texts: List[str]) -> List[List[int]]:
+    """
+    Groups texts, by their index, in batches respecting the item and token budgets of an embedding request.
+    """
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    batch_tokens = 0
+
+    for i, text in enumerate(texts):
+        tokens = tokens_count(text)
+        if batch and (
+            len(batch) >= OAI_EMBEDDING_BATCH_ITEMS
+            or batch_tokens + tokens > OAI_EMBEDDING_BATCH_TOKENS
+        ):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(i)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+async def embeddings_request(texts: List[str], user: UUID) -> List[List[float]]:
+    """
+    Returns the embeddings of texts from OpenAI, in one request.
+
+    If the request is rejected as too large, it is split in two, recursively.
+    """
+    try:
+        res = await embeddings_create(texts, user)
+    except openai.error.InvalidRequestError as e:
+        if len(texts) == 1:
+            raise e
+        logger.warning(f"Embedding batch of {len(texts)} texts rejected, splitting")
+        half = len(texts) // 2
+        return await embeddings_request(texts[:half], user) + await embeddings_request(
+            texts[half:], user
+        )
+
+    # Order of the results is not guaranteed, use their index
+    return [data.embedding for data in sorted(res.data, key=lambda data: data.index)]
+
+
+def oai_is_transient(e: BaseException) -> bool:
+    """
+    Returns True if the exception is an OpenAI error which can succeed when retried.
+
+    Rate limits, timeouts, connection errors and server errors are transient. Request, permission and quota errors, and bugs, are not.
+    """
+    # Quota is reported as a rate limit, it is not restored by waiting a few seconds
+    if (
+        isinstance(e, openai.error.RateLimitError)
+        and e.error
+        and e.error.get("code") == "insufficient_quota"
+    ):
+        return False
+    if isinstance(
+        e,
+        (
+            openai.error.APIConnectionError,
+            openai.error.RateLimitError,
+            openai.error.ServiceUnavailableError,
+            openai.error.Timeout,
+            openai.error.TryAgain,
+        ),
+    ):
+        return True
+    return isinstance(e, openai.error.APIError) and (e.http_status or 0) >= 500
+
+
+# Exponential backoff, mostly for the rate limits when indexing
+@retry(
+    retry=retry_if_exception(oai_is_transient),
+    reraise=True,
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(multiplier=0.5, max=30),
+)
+async def embeddings_create(
+    texts: List[str], user: UUID
+) -> openai.openai_object.OpenAIObject:
+    user_hash = str_anonymization(user.bytes)
+    return await openai.Embedding.acreate(
+        **OAI_EMBEDDING_ARGS,
+        input=texts,
+        user=user_hash,  # Unique identifier representing your end-user, which can help OpenAI to monitor and detect abuse
+    )
 
 
-async def index_engine(user: UUID, force: bool = False) -> None:
-    async with aiohttp.ClientSession() as session:
-        workshops = await session.get("https://microsoft.github.io/moaw/workshops.json")
-        workshops = await workshops.json()
+class EmbeddingBatcher:
+    """
+    Groups the texts to embed from concurrent callers into batched requests.
 
-        ids = []
-        payloads = []
-        vectors = []
+    A batch is sent when it reaches the item or token budget, or when no text has been added for the linger delay. Batches are sent under the embedding stage semaphore of the indexer.
+    """
 
-        for workshop in workshops:
-            identifier = workshop.get("id")
-            metadata = MetadataModel(
-                audience=workshop.get("audience"),
-                authors=workshop.get("authors"),
-                description=workshop.get("description"),
-                language=workshop.get("language"),
-                last_updated=datetime.fromisoformat(workshop.get("lastUpdated")),
-                tags=workshop.get("tags"),
-                title=workshop.get("title"),
-                url=workshop.get("url"),
+    def __init__(self, user: UUID) -> None:
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._pending_tokens = 0
+        self._tasks: Set[asyncio.Task] = set()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._user = user
+
+    async def embed(self, text: str) -> List[float]:
+        tokens = tokens_count(text)
+        if self._pending and (
+            len(self._pending) >= OAI_EMBEDDING_BATCH_ITEMS
+            or self._pending_tokens + tokens > OAI_EMBEDDING_BATCH_TOKENS
+        ):
+            self._flush()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        self._pending_tokens += tokens
+
+        if len(self._pending) >= OAI_EMBEDDING_BATCH_ITEMS:
+            self._flush()
+        else:
+            if self._timer:
+                self._timer.cancel()
+            self._timer = asyncio.get_running_loop().call_later(
+                OAI_EMBEDDING_BATCH_LINGER_SECS, self._flush
             )
 
-            if not force:
-                try:
-                    res = qd_client.retrieve(
-                        collection_name=QD_COLLECTION, ids=[identifier]
-                    )
-                    if len(res) > 0:
-                        stored = MetadataModel(**res[0].payload)
-                        logger.info(stored.last_updated)
-                        logger.info(metadata.last_updated)
-                        if stored.last_updated == metadata.last_updated:
-                            logger.info(f'Workshop "{metadata.title}" already indexed')
-                            continue
-                except Exception:
-                    logger.exception("Error searching for workshops", exc_info=True)
+        return await future
 
-            logger.info(f"Parsing workshop {metadata.title}...")
-            text = await embedding_text_from_metadata(metadata, session)
-            logger.debug(f"Text: {text}")
-            vector = await vector_from_text(text, user)
+    def _flush(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
 
-            # Create Qdrant payload
-            vectors.append(vector)
-            ids.append(identifier)
-            payloads.append(metadata.dict())
+        batch, self._pending = self._pending, []
+        self._pending_tokens = 0
+        task = asyncio.create_task(self._send(batch))
+        # Keep a reference to the task, so it is not garbage collected before its end
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
 
-        if len(ids) == 0:
-            logger.info("No new workshops to index")
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        logger.debug(f"Sending embedding batch of {len(batch)} texts")
+        try:
+            async with index_embed_sem:
+                vectors = await vectors_from_texts(
+                    [text for text, _ in batch], self._user, cached=False
+                )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
             return
 
-        # Insert into Qdrant
-        qd_client.upsert(
-            collection_name=QD_COLLECTION,
-            points=qmodels.Batch(
-                ids=ids,
-                payloads=payloads,
-                vectors=vectors,
-            ),
-        )
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
 
-        logger.info(f"Indexed {len(workshops)} workshops")
+def vector_encode(vector: List[float]) -> bytes:
+    """
+    Returns a vector as compact float32 bytes, in the machine byte order.
+    """
+    return array("f", vector).tobytes()
 
 
-@retry(stop=stop_after_attempt(3))
-async def vector_from_text(prompt: str, user: UUID) -> List[float]:
-    logger.debug(f"Getting vector for text: {prompt}")
-    user_hash = str_anonymization(user.bytes)
-    try:
-        res = openai.Embedding.create(
-            **OAI_EMBEDDING_ARGS,
-            input=prompt,
-            user=user_hash,  # Unique identifier representing your end-user, which can help OpenAI to monitor and detect abuse
-        )
-    except openai.error.AuthenticationError as e:
-        logger.exception(e)
-        return []
+def vector_decode(raw: bytes) -> List[float]:
+    """
+    Returns a vector from its float32 bytes representation.
+    """
+    vector = array("f")
+    vector.frombytes(raw)
+    return vector.tolist()
 
-    return res.data[0].embedding
 
+@retry(
+    retry=retry_if_not_exception_type(asyncio.CancelledError),
+    stop=stop_after_attempt(3),
+)
+async def completion_from_text(
+    search: SearchModel, cache_key: str, user: UUID
+) -> Optional[str]:
+    """
+    Streams the completion to the Redis stream cache_key and returns the full message.
 
-@retry(stop=stop_after_attempt(3))
-def completion_from_text(search: SearchModel, cache_key: str, user: UUID) -> None:
+    If the stream already contains messages (previous attempt or previous producer), a reset marker is sent first so the readers drop them. Tokens are grouped in messages bounded in size and in delay, the stopword is sent with the last group. The delay is a timer, a group is sent when it expires even if the model stalls.
+    """
     logger.debug(f"Getting completion for text: {search.query}")
-    training = prompt_from_search(search)
+    with METRICS_STAGE_DURATION.labels(stage="prompt").time():
+        training, prompt_tokens = prompt_from_search(search)
+    METRICS_SUGGESTION_PROMPT_TOKENS.observe(prompt_tokens)
+    logger.info(f"Prompt for suggestion {search.query} is {prompt_tokens} tokens")
     user_hash = str_anonymization(user.bytes)
 
     try:
         # Use chat completion to get a more natural response and lower the usage cost
-        chunks = openai.ChatCompletion.create(
+        chunks = await openai.ChatCompletion.acreate(
             **OAI_COMPLETION_ARGS,
             messages=[
                 {"role": "system", "content": training},
@@ -600,21 +2532,152 @@ def completion_from_text(search: SearchModel, cache_key: str, user: UUID) -> Non
         )
     except openai.error.AuthenticationError as e:
         logger.exception(e)
-        return
+        return None
 
-    for chunk in chunks:
-        content = chunk["choices"][0].get("delta", {}).get("content")
-        if content is not None:
-            logger.debug(f"Completion result: {content}")
-            # add content to the redis stream cache_key
-            redis_client_api.xadd(cache_key, {"message": content})
+    if await redis_client_api.xlen(cache_key) > 0:
+        await stream_add(cache_key, [REDIS_STREAM_RESETWORD])
 
+    message_full = ""
+    batch = ""
+    batch_start = 0
+    # Next chunk is awaited in a task, it is not cancelled when the group delay expires
+    next_chunk: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if next_chunk is None:
+                next_chunk = asyncio.ensure_future(chunks.__anext__())
+            linger = None
+            if batch:
+                linger = max(
+                    0, batch_start + REDIS_STREAM_BATCH_LINGER_SECS - time.monotonic()
+                )
+
+            done, _ = await asyncio.wait({next_chunk}, timeout=linger)
+            if not done:
+                await stream_add(cache_key, [batch])
+                batch = ""
+                continue
+
+            received, next_chunk = next_chunk, None
+            try:
+                chunk = received.result()
+            except StopAsyncIteration:
+                break
+
+            content = chunk["choices"][0].get("delta", {}).get("content")
+            if not content:
+                continue
+
+            logger.debug(f"Completion result: {content}")
+            if not batch:
+                batch_start = time.monotonic()
+            batch += content
+            message_full += content
+
+            if len(batch) >= REDIS_STREAM_BATCH_CHARS:
+                await stream_add(cache_key, [batch])
+                batch = ""
+    finally:
+        # Close the HTTP stream now, a cancelled generation stops consuming tokens
+        if next_chunk is not None:
+            next_chunk.cancel()
+            await asyncio.gather(next_chunk, return_exceptions=True)
+        await chunks.aclose()
+
+    # Last group is sent with the stopword
     logger.debug(f"Completion result: {REDIS_STREAM_STOPWORD}")
-    redis_client_api.xadd(cache_key, {"message": REDIS_STREAM_STOPWORD})
+    messages = [batch] if batch else []
+    messages.append(REDIS_STREAM_STOPWORD)
+    await stream_add(cache_key, messages)
+
+    return message_full
+
+
+async def stream_add(key: str, messages: List[str]) -> None:
+    """
+    Adds messages to a Redis stream, in a single round-trip.
+
+    The stream is trimmed to an approximate maximum length.
+    """
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        for message in messages:
+            pipe.xadd(
+                key,
+                {"message": message},
+                approximate=True,
+                maxlen=REDIS_STREAM_MAXLEN,
+            )
+        await pipe.execute()
 
 
-@retry(stop=stop_after_attempt(3))
 async def is_moderated(prompt: str) -> bool:
+    """
+    Returns True if the prompt is flagged by Azure Content Safety.
+
+    Verdicts are cached in the worker and in Redis, by normalized prompt. Severities are cached instead of the verdict, so a change of the threshold applies to them. Cache hits do not extend the TTL, so flagged verdicts expire on time, in the worker as in Redis.
+    """
+    start = time.monotonic()
+    cache_key = await moderation_cache_key(prompt)
+
+    moderation = moderation_cache.get(cache_key)
+    if not moderation:
+        async with redis_client_api.pipeline(transaction=False) as pipe:
+            pipe.get(cache_key)
+            pipe.pttl(cache_key)
+            moderation_raw, ttl_ms = await pipe.execute()
+        if moderation_raw:
+            moderation = ModerationModel.parse_raw(moderation_raw)
+            # Kept in the worker until it expires from Redis
+            moderation_cache.set(
+                cache_key,
+                moderation,
+                ttl=ttl_ms / 1000 if ttl_ms > 0 else moderation_ttl(moderation),
+            )
+
+    hit = moderation is not None
+    if not moderation:
+        moderation = await moderation_analyze(prompt)
+        if not moderation:
+            return False
+
+        ttl = moderation_ttl(moderation)
+        moderation_cache.set(cache_key, moderation, ttl=ttl)
+        await redis_client_api.set(cache_key, moderation.json(), ex=ttl)
+
+    cache_stats_record("moderation", hit, time.monotonic() - start)
+
+    return moderation_flagged(moderation)
+
+
+def moderation_flagged(moderation: ModerationModel) -> bool:
+    """
+    Returns True if one of the severities reaches the threshold.
+    """
+    return any(
+        severity >= ACS_SEVERITY_THRESHOLD
+        for severity in moderation.severities.values()
+    )
+
+
+def moderation_ttl(moderation: ModerationModel) -> int:
+    """
+    Returns the TTL of a cached moderation, flagged ones are kept shorter.
+    """
+    if moderation_flagged(moderation):
+        return MODERATION_CACHE_FLAGGED_TTL_SECS
+    return MODERATION_CACHE_SAFE_TTL_SECS
+
+
+@retry(
+    retry=retry_if_not_exception_type(asyncio.CancelledError),
+    stop=stop_after_attempt(3),
+)
+async def moderation_analyze(prompt: str) -> Optional[ModerationModel]:
+    """
+    Returns the severities of the prompt, by category, from Azure Content Safety.
+
+    If the service cannot be authenticated, None is returned.
+    """
     logger.debug(f"Checking moderation for text: {prompt}")
 
     req = azure_cs.models.AnalyzeTextOptions(
@@ -628,24 +2691,31 @@ async def is_moderated(prompt: str) -> bool:
     )
 
     try:
-        res = acs_client.analyze_text(req)
+        res = await acs_client.analyze_text(req)
     except azure_exceptions.ClientAuthenticationError as e:
         logger.exception(e)
-        return False
+        return None
 
     logger.debug(f"Moderation result: {res}")
-    return any(
-        cat.severity >= ACS_SEVERITY_THRESHOLD
-        for cat in [
-            res.hate_result,
-            res.self_harm_result,
-            res.sexual_result,
-            res.violence_result,
-        ]
+    results = {
+        "hate": res.hate_result,
+        "self_harm": res.self_harm_result,
+        "sexual": res.sexual_result,
+        "violence": res.violence_result,
+    }
+    return ModerationModel(
+        severities={
+            category: result.severity for category, result in results.items() if result
+        }
     )
 
 
-def prompt_from_search(search: SearchModel) -> str:
+def prompt_from_search(search: SearchModel) -> Tuple[str, int]:
+    """
+    Returns the system prompt of a suggestion and its number of tokens.
+
+    Workshops are added from the most relevant, as long as the prompt and the query fit in the token budget, the least relevant ones are dropped. Their context blocks are cached.
+    """
     prompt = textwrap.dedent(
         f"""
         You are a training consultant. You are working for Microsoft. You have 20 years' experience in the technology industry and have also worked as a life coach. Today, we are the {datetime.now()}.
@@ -680,53 +2750,106 @@ def prompt_from_search(search: SearchModel) -> str:
     """
     )
 
+    tokens = tokens_count(prompt) + tokens_count(search.query)
+
     for i, result in enumerate(search.answers):
-        prompt += textwrap.dedent(
-            f"""
-            WORKSHOP START #{i}
+        block, block_tokens = prompt_workshop_block(result)
+        block_start = f"\nWORKSHOP START #{i}\n"
+        block = block_start + block
+        block_tokens += tokens_count(block_start)
+        if tokens + block_tokens > OAI_COMPLETION_PROMPT_TOKENS:
+            logger.debug(
+                f"Prompt budget reached, dropping {len(search.answers) - i} workshops"
+            )
+            break
+        prompt += block
+        tokens += block_tokens
+
+    return prompt, tokens
+
+
+def prompt_workshop_block(answer: SearchAnswerModel) -> Tuple[str, int]:
+    """
+    Returns the context block of a workshop for the prompt, and its number of tokens.
 
-            Audience:
-            {result.metadata.audience}
+    Blocks are cached, keyed by the metadata they render, so a workshop updated by the indexer gets a new block. The description is truncated to a fixed number of tokens.
+    """
+    metadata = answer.metadata
+    start = time.monotonic()
+    cache_key = (answer.id, metadata_hash(metadata))
+    cached = prompt_block_cache.get(cache_key)
+    cache_stats_record("prompt_block", cached is not None, time.monotonic() - start)
+    if cached:
+        return cached
+
+    encoding = tiktoken.encoding_for_model(OAI_COMPLETION_ARGS["model"])
+    description = encoding.decode(
+        encoding.encode(metadata.description, disallowed_special=())[
+            :OAI_COMPLETION_DESCRIPTION_TOKENS
+        ]
+    )
+    block = textwrap.dedent(
+        f"""
+        Audience:
+        {metadata.audience}
 
-            Authors:
-            {result.metadata.authors}
+        Authors:
+        {metadata.authors}
 
-            Description:
-            {result.metadata.description}
+        Description:
+        {description}
 
-            Language:
-            {result.metadata.language}
+        Language:
+        {metadata.language}
 
-            Last updated:
-            {result.metadata.last_updated}
+        Last updated:
+        {metadata.last_updated}
 
-            Tags:
-            {result.metadata.tags}
+        Tags:
+        {metadata.tags}
 
-            Title:
-            {result.metadata.title}
+        Title:
+        {metadata.title}
 
-            URL:
-            {result.metadata.url}
+        URL:
+        {metadata.url}
 
-            WORKSHOP END
+        WORKSHOP END
 
-        """
-        )
+    """
+    )
 
-    return prompt
+    cached = (block, tokens_count(block))
+    prompt_block_cache.set(cache_key, cached)
+    return cached
 
 
-async def embedding_text_from_metadata(
-    metadata: MetadataModel, session: aiohttp.ClientSession
+def lexical_text_from_metadata(
+    metadata: MetadataModel, description: str, content: str
 ) -> str:
-    description = await sanitize_for_embedding(metadata.description)
-    (content_raw, url) = await workshop_scrapping(metadata.url, session)
-    content_clean = (await sanitize_for_embedding(content_raw))[:7500]
+    """
+    Returns the text to index lexically for a workshop, from its metadata and its sanitized description and content.
+
+    The whole content is indexed, it is not limited by the embedding model.
+    """
+    return "\n".join(
+        [
+            metadata.title,
+            description,
+            " ".join(metadata.tags),
+            " ".join(metadata.authors),
+            " ".join(metadata.audience),
+            content,
+        ]
+    )
 
-    # Update model with the real URL
-    metadata.url = url.human_repr()
 
+def embedding_text_from_metadata(
+    metadata: MetadataModel, description: str, content: str
+) -> str:
+    """
+    Returns the text to embed for a chunk of a workshop, from its metadata and its sanitized description and content chunk.
+    """
     return textwrap.dedent(
         f"""
         Title:
@@ -736,7 +2859,7 @@ async def embedding_text_from_metadata(
         {description}
 
         Content:
-        {content_clean}
+        {content}
 
         Tags:
         {", ".join(metadata.tags)}
@@ -753,41 +2876,25 @@ async def embedding_text_from_metadata(
     )
 
 
-async def sanitize_for_embedding(raw: str) -> str:
-    """
-    Takes a raw string of HTML and removes all HTML tags, Markdown tables, and line returns.
-    """
-    # Remove HTML doctype
-    raw = re.sub(r"<!DOCTYPE[^>]*>", " ", raw)
-    # Remove HTML head
-    raw = re.sub(r"<head\b[^>]*>[\s\S]*<\/head>", " ", raw)
-    # Remove HTML scripts
-    raw = re.sub(r"<script\b[^>]*>[\s\S]*?<\/script>", " ", raw)
-    # Remove HTML styles
-    raw = re.sub(r"<style\b[^>]*>[\s\S]*?<\/style>", " ", raw)
-    # Remove HTML tags
-    raw = re.sub(r"<[^>]*>", " ", raw)
-    # Remove Markdown tables
-    raw = re.sub(r"[-|]{2,}", " ", raw)
-    # Remove Markdown code blocks
-    raw = re.sub(r"```[\s\S]*```", " ", raw)
-    # Remove Markdown bold, italic, strikethrough, code, heading, table delimiters, links, images, comments, and horizontal rules
-    raw = re.sub(r"[*_`~#|!\[\]<>-]+", " ", raw)
-    # Remove line returns, tabs and spaces
-    raw = re.sub(r"[\n\t\v ]+", " ", raw)
-    # Remove HTML entities
-    raw = html.unescape(raw)
-    # Remove leading and trailing spaces
-    raw = raw.strip()
-
-    return raw
+def http_is_throttled(e: BaseException) -> bool:
+    """
+    Returns True if the exception is an HTTP response asking to slow down.
+    """
+    return isinstance(e, aiohttp.ClientResponseError) and e.status in (429, 503)
 
 
+@retry(
+    retry=retry_if_exception(http_is_throttled),
+    stop=stop_after_attempt(5),
+    wait=wait_random_exponential(multiplier=0.5, max=30),
+)
 async def workshop_scrapping(
-    url: str, session: aiohttp.ClientSession
-) -> Tuple[str, URL]:
+    url: str, session: aiohttp.ClientSession, conditional: bool = False
+) -> Tuple[Optional[str], URL, HttpValidatorModel]:
     """
-    Scrapes the workshop from the given URL and returns the content as a string.
+    Scrapes the workshop from the given URL and returns the content as a string, the real URL, and the validator of the page.
+
+    If conditional and the page is not modified since the last indexing, the content is None. Throttled requests are retried with an exponential backoff.
     """
     logger.debug(f"Scraping workshop from {url}")
 
@@ -800,13 +2907,139 @@ async def workshop_scrapping(
         return_url = URL(f"https://microsoft.github.io/moaw/workshop/{url}")
         logger.debug(f"Using workshop Markdown file {scrapping_url}")
 
-    res = await session.get(scrapping_url)
+    content, res_url, validator = await http_get(scrapping_url, session, conditional)
 
     if not return_url:
-        logger.debug(f"Override workshop URL for {res.url}")
-        return_url = res.url
+        logger.debug(f"Override workshop URL for {res_url}")
+        return_url = res_url
+
+    return (content, return_url, validator)
+
+
+async def http_get(
+    url: str, session: aiohttp.ClientSession, conditional: bool
+) -> Tuple[Optional[str], URL, HttpValidatorModel]:
+    """
+    Returns the content of the URL, the real URL after redirections, and the validator of the response.
+
+    If conditional, the cached validator (ETag, Last-Modified) of the URL is sent with the request. If the server answers with a HTTP 304, the content is None and the cached validator is returned, with the size of the content not downloaded. Validators are not cached here, see http_validator_save.
+
+    Conditional requests are recorded in the cache statistics, as a hit if the content is not modified.
+    """
+    start = time.monotonic()
+    headers = {}
+    validator = None
+
+    if conditional:
+        validator_raw = await redis_client_api.get(await http_validator_key(url))
+        if validator_raw:
+            validator = HttpValidatorModel.parse_raw(validator_raw)
+            if validator.etag:
+                headers["If-None-Match"] = validator.etag
+            if validator.last_modified:
+                headers["If-Modified-Since"] = validator.last_modified
+
+    res = await session.get(url, headers=headers)
+    res.raise_for_status()
+
+    if res.status == status.HTTP_304_NOT_MODIFIED and validator:
+        logger.debug(f"Not modified {url}")
+        cache_stats_record("http_validator", True, time.monotonic() - start)
+        return (None, res.url, validator)
+
+    content = await res.read()
+    if conditional:
+        cache_stats_record("http_validator", False, time.monotonic() - start)
+    return (
+        await res.text(),
+        res.url,
+        HttpValidatorModel(
+            etag=res.headers.get("ETag"),
+            last_modified=res.headers.get("Last-Modified"),
+            size=len(content),
+            url=url,
+        ),
+    )
+
+
+async def http_validator_save(validator: HttpValidatorModel) -> None:
+    """
+    Caches the validator of a URL, for the next conditional requests.
+    """
+    if not (validator.etag or validator.last_modified):
+        return
+    await redis_client_api.set(
+        await http_validator_key(validator.url),
+        validator.json(),
+        ex=HTTP_VALIDATOR_TTL_SECS,
+    )
+
+
+cache_stats: Dict[str, CacheStatsModel] = {}
+
+
+def cache_stats_record(family: str, hit: bool, duration: float, count: int = 1) -> None:
+    """
+    Records cache lookups in the statistics of the given family, with the duration of the whole request.
+    """
+    METRICS_CACHE_LOOKUPS.labels(family=family, result="hit" if hit else "miss").inc(
+        count
+    )
+    stats = cache_stats.setdefault(family, CacheStatsModel())
+
+    if hit:
+        stats.hit_latency = (stats.hit_latency * stats.hits + duration * count) / (
+            stats.hits + count
+        )
+        stats.hits += count
+    else:
+        stats.miss_latency = (stats.miss_latency * stats.misses + duration * count) / (
+            stats.misses + count
+        )
+        stats.misses += count
+
+    stats.hit_ratio = stats.hits / (stats.hits + stats.misses)
+
+
+def metadata_hash(metadata: MetadataModel) -> bytes:
+    """
+    Returns a hash of the metadata of a workshop, which changes when the workshop is updated.
+    """
+    return mmh3.hash_bytes(metadata.json().encode("utf-8"))
+
+
+def tokens_count(text: str) -> int:
+    """
+    Returns the number of tokens of a text, for the OpenAI models used (both use the same encoding).
+    """
+    encoding = tiktoken.encoding_for_model(OAI_EMBEDDING_ARGS["model"])
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def stream_id_parse(message_id: Union[bytes, str]) -> Tuple[int, int]:
+    """
+    Returns a Redis stream message ID as a comparable tuple (timestamp, sequence).
+    """
+    if isinstance(message_id, bytes):
+        message_id = message_id.decode("utf-8")
+    timestamp, sequence = message_id.split("-")
+    return (int(timestamp), int(sequence))
+
+
+def query_normalize(query: str) -> str:
+    """
+    Returns the normalized form of a query, used to share caches between the variants of the same query.
+
+    Unicode is normalized (NFKC), case is folded, and whitespaces are collapsed.
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
 
-    return (await res.text(), return_url)
+
+def query_hash(query: str) -> str:
+    """
+    Returns a short hash of a normalized query, as a hexadecimal string, to be used in cache keys.
+    """
+    return mmh3.hash_bytes(query.encode("utf-8")).hex()
 
 
 def str_anonymization(bytes: bytes) -> str:
@@ -820,11 +3053,135 @@ def str_anonymization(bytes: bytes) -> str:
     return str_hash
 
 
-async def suggestion_cache_key(str: str) -> str:
+def suggestion_fingerprint(search: SearchModel) -> str:
+    """
+    Returns the fingerprint of the suggestion of a search, as a hexadecimal string.
+
+    The prompt of the suggestion depends on the normalized query and on the workshops answered, in order, with their version. Searches with the same fingerprint share their suggestion, whatever their limit.
+    """
+    fingerprint = query_normalize(search.query).encode("utf-8")
+    for answer in search.answers:
+        fingerprint += answer.id.bytes + metadata_hash(answer.metadata)
+    return mmh3.hash_bytes(fingerprint).hex()
+
+
+async def suggestion_cache_get(fingerprint: str) -> Optional[bytes]:
+    """
+    Returns the cached suggestion of a fingerprint, if any.
+
+    Requests are counted, the TTL of a cached suggestion grows with its popularity, up to SUGGESTION_CACHE_MAX_TTL_SECS.
+    """
+    start = time.monotonic()
+    suggestion_key = await suggestion_cache_key(fingerprint)
+    hits_key = await suggestion_hits_key(fingerprint)
+
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        pipe.get(suggestion_key)
+        pipe.incr(hits_key)
+        pipe.expire(hits_key, SUGGESTION_CACHE_MAX_TTL_SECS)
+        message, hits, _ = await pipe.execute()
+    cache_stats_record("suggestion", message is not None, time.monotonic() - start)
+
+    if message:
+        await redis_client_api.expire(
+            suggestion_key,
+            min(GLOBAL_CACHE_TTL_SECS * hits, SUGGESTION_CACHE_MAX_TTL_SECS),
+            gt=True,
+        )
+
+    return message
+
+
+async def suggestion_cache_invalidate(workshop_ids: List[str]) -> None:
+    """
+    Deletes the cached suggestions referencing the given workshops.
+    """
+    if not workshop_ids:
+        return
+
+    workshop_keys = [
+        await suggestion_workshop_key(workshop_id) for workshop_id in workshop_ids
+    ]
+    async with redis_client_api.pipeline(transaction=False) as pipe:
+        for workshop_key in workshop_keys:
+            pipe.smembers(workshop_key)
+        members = await pipe.execute()
+
+    keys = set(itertools.chain(*members))
+    await redis_client_api.unlink(*keys, *workshop_keys)
+    logger.info(f"Invalidated {len(keys)} cached suggestions")
+
+
+async def suggestion_cache_key(fingerprint: str) -> str:
+    """
+    Returns the key to use to cache the suggestion for the given fingerprint.
+    """
+    return f"suggestion:{fingerprint}"
+
+
+async def suggestion_hits_key(fingerprint: str) -> str:
+    """
+    Returns the key counting the requests of the suggestion for the given fingerprint.
+    """
+    return f"suggestion-hits:{fingerprint}"
+
+
+async def suggestion_workshop_key(workshop_id: str) -> str:
+    """
+    Returns the key of the set of the cached suggestions referencing the given workshop.
+    """
+    return f"suggestion-workshop:{workshop_id}"
+
+
+async def suggestion_stream_key(fingerprint: str) -> str:
+    """
+    Returns the key of the Redis stream where the suggestion for the given fingerprint is produced.
+    """
+    return f"suggestion-stream:{fingerprint}"
+
+
+async def suggestion_lease_key(fingerprint: str) -> str:
+    """
+    Returns the key of the lease held by the producer of the suggestion for the given fingerprint.
+    """
+    return f"suggestion-lease:{fingerprint}"
+
+
+async def suggestion_attempts_key(fingerprint: str) -> str:
+    """
+    Returns the key counting the generations started for the suggestion for the given fingerprint.
+    """
+    return f"suggestion-attempts:{fingerprint}"
+
+
+async def suggestion_readers_key(fingerprint: str) -> str:
+    """
+    Returns the key counting the readers of the suggestion for the given fingerprint.
+    """
+    return f"suggestion-readers:{fingerprint}"
+
+
+async def embedding_cache_key(text: str) -> str:
+    """
+    Returns the key to use to cache the embedding of the given text.
+    """
+    return f"embedding:{mmh3.hash_bytes(text.encode('utf-8')).hex()}"
+
+
+async def http_validator_key(url: str) -> str:
+    """
+    Returns the key to use to cache the HTTP validator of the given URL.
+    """
+    return f"http-validator:{mmh3.hash_bytes(url.encode('utf-8')).hex()}"
+
+
+async def moderation_cache_key(prompt: str) -> str:
     """
-    Returns the key to use to cache the suggestions for the given string.
+    Returns the key to use to cache the moderation of the given prompt.
+
+    Variants of the same prompt share the same key.
     """
-    return f"suggestion:{str}"
+    return f"moderation:{query_hash(query_normalize(prompt))}"
 
 
 async def token_cache_key(str: str) -> str:
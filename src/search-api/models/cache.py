@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+
+class CacheStatsModel(BaseModel):
+    hit_latency: float = 0
+    hit_ratio: float = 0
+    hits: int = 0
+    miss_latency: float = 0
+    misses: int = 0
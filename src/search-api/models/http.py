@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+from typing import Optional
+
+
+class HttpValidatorModel(BaseModel):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int
+    url: str
@@ -0,0 +1,6 @@
+from pydantic import BaseModel
+from typing import Dict
+
+
+class ModerationModel(BaseModel):
+    severities: Dict[str, int]
@@ -0,0 +1,10 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import Dict, Optional
+
+
+class CollectionStatsModel(BaseModel):
+    languages: Dict[str, int]
+    tags: Dict[str, int]
+    total: int
+    updated_at: Optional[datetime]
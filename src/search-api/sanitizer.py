@@ -0,0 +1,54 @@
+import html
+import re
+
+
+# HTML doctype
+DOCTYPE_PATTERN = re.compile(r"<!DOCTYPE[^>]*>")
+# HTML head, from the first opening tag to the last closing tag
+HEAD_OPEN_PATTERN = re.compile(r"<head\b[^>]*>")
+HEAD_CLOSE = "</head>"
+# HTML scripts, then styles, then any other tag
+SCRIPT_PATTERN = re.compile(r"<script\b[^>]*>.*?</script>", re.DOTALL)
+STYLE_PATTERN = re.compile(r"<style\b[^>]*>.*?</style>", re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]*>")
+# Markdown code blocks, from the first fence to the last fence
+CODE_FENCE = "```"
+# Markdown bold, italic, strikethrough, code, heading, tables, links, images, comments, horizontal rules, and whitespaces
+TEXT_PATTERN = re.compile(r"[*_`~#|!\[\]<>\n\t\v -]+")
+
+
+def sanitize_for_embedding(raw: str) -> str:
+    """
+    Takes a raw string of HTML and removes all HTML tags, Markdown tables, and line returns.
+
+    Pure function without side effect at import, so it can be run in a process pool. Rules are precompiled and applied in the same order as the regular expressions this function replaced, so its output is the same. Greedy rules, the HTML head and the Markdown code blocks, are resolved by searching their delimiters from both ends, without backtracking.
+    """
+    # Remove HTML doctype
+    raw = DOCTYPE_PATTERN.sub(" ", raw)
+    # Remove HTML head
+    head = HEAD_OPEN_PATTERN.search(raw)
+    if head:
+        head_end = raw.rfind(HEAD_CLOSE)
+        if head_end >= head.end():
+            raw = f"{raw[:head.start()]} {raw[head_end + len(HEAD_CLOSE):]}"
+
+    # Remove HTML scripts, styles, and tags, in this order, as scripts and styles can contain each other
+    raw = SCRIPT_PATTERN.sub(" ", raw)
+    raw = STYLE_PATTERN.sub(" ", raw)
+    raw = TAG_PATTERN.sub(" ", raw)
+
+    # Remove Markdown code blocks
+    fence_start = raw.find(CODE_FENCE)
+    if fence_start >= 0:
+        fence_end = raw.rfind(CODE_FENCE)
+        if fence_end >= fence_start + len(CODE_FENCE):
+            raw = f"{raw[:fence_start]} {raw[fence_end + len(CODE_FENCE):]}"
+
+    # Remove Markdown syntax and Markdown tables, and collapse whitespaces
+    raw = TEXT_PATTERN.sub(" ", raw)
+    # Remove HTML entities
+    raw = html.unescape(raw)
+    # Remove leading and trailing spaces
+    raw = raw.strip()
+
+    return raw
@@ -0,0 +1,34 @@
+import os
+import pytest
+
+
+# Clients are created at the import of the API, without connecting, they only need their settings
+os.environ.setdefault("MS_ACS_API_BASE", "https://localhost")
+os.environ.setdefault("MS_ACS_API_TOKEN", "test")
+os.environ.setdefault("MS_QD_HOST", "localhost")
+os.environ.setdefault("MS_REDIS_HOST", "localhost")
+os.environ.setdefault("VERSION", "0.0.0-test")
+
+
+class WordEncoding:
+    """
+    Encoding with a token per word, so the token counts of the tests are known in advance.
+    """
+
+    def encode(self, text: str, **kwargs) -> list:
+        return text.split(" ")
+
+    def decode(self, tokens: list) -> str:
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def word_encoding(monkeypatch) -> WordEncoding:
+    """
+    Replaces the OpenAI encoding of the API by WordEncoding.
+    """
+    import main
+
+    encoding = WordEncoding()
+    monkeypatch.setattr(main.tiktoken, "encoding_for_model", lambda model: encoding)
+    return encoding
@@ -0,0 +1,111 @@
+import math
+from bm25 import Bm25Index, tokenize
+
+
+def index_workshops() -> Bm25Index:
+    index = Bm25Index()
+    index.add(
+        "aks", "Deploy a Kubernetes cluster on AKS, then scale the Kubernetes nodes"
+    )
+    index.add("functions", "Build serverless APIs with Azure Functions")
+    index.add(
+        "containers", "Run containers on Azure Container Apps, without Kubernetes"
+    )
+    index.add("static", "Host a static website on Azure Storage")
+    return index
+
+
+def test_tokenize() -> None:
+    """
+    Tests terms are normalized with NFKC and case-folded.
+    """
+    assert tokenize("Ｋubernetes, AKS & Straße!") == ["kubernetes", "aks", "strasse"]
+
+
+def test_search_idf() -> None:
+    """
+    Tests rare terms weigh more than common ones, and the IDF matches the BM25 formula.
+    """
+    index = index_workshops()
+
+    # "azure" is in 3 documents out of 4, "serverless" in 1 only
+    assert index.search("azure serverless", 10)[0][0] == "functions"
+
+    idf = math.log(1 + (4 - 1 + 0.5) / (1 + 0.5))
+    score = dict(index.search("static", 10))["static"]
+    length = len(tokenize("Host a static website on Azure Storage"))
+    length_avg = index._total_length / len(index)
+    norm = 1.2 * (1 - 0.75 + 0.75 * length / length_avg)
+    assert math.isclose(score, idf * (1 * 2.2) / (1 + norm))
+
+
+def test_search_ranking() -> None:
+    """
+    Tests documents are ranked by term frequency, and only matching documents are returned, up to the limit.
+    """
+    index = index_workshops()
+
+    assert [doc_id for doc_id, _ in index.search("kubernetes", 10)] == [
+        "aks",
+        "containers",
+    ]
+    assert len(index.search("kubernetes", 1)) == 1
+    assert index.search("unknown", 10) == []
+    assert Bm25Index().search("kubernetes", 10) == []
+
+
+def test_add_replaces() -> None:
+    """
+    Tests adding a document again replaces its previous version.
+    """
+    index = index_workshops()
+    index.add("aks", "Monitor an application with Application Insights")
+
+    assert len(index) == 4
+    assert "aks" not in dict(index.search("kubernetes", 10))
+    assert index.search("insights", 10)[0][0] == "aks"
+
+
+def test_remove() -> None:
+    """
+    Tests a removed document is not found anymore, and the index is the same as if it was never added.
+    """
+    index = index_workshops()
+    index.remove("aks")
+    index.remove("unknown")
+
+    expected = Bm25Index()
+    expected.add("functions", "Build serverless APIs with Azure Functions")
+    expected.add(
+        "containers", "Run containers on Azure Container Apps, without Kubernetes"
+    )
+    expected.add("static", "Host a static website on Azure Storage")
+
+    assert "aks" not in index
+    assert len(index) == 3
+    assert index.search("kubernetes azure", 10) == expected.search(
+        "kubernetes azure", 10
+    )
+    # Terms only used by the removed document are dropped
+    assert "cluster" not in index._postings
+    assert index._postings == expected._postings
+    assert index._total_length == expected._total_length
+
+
+def test_dumps_loads() -> None:
+    """
+    Tests an index loaded from its serialization gives the same results, and can still be modified.
+    """
+    index = index_workshops()
+    index.remove("static")
+    loaded = Bm25Index.loads(index.dumps())
+
+    assert len(loaded) == len(index)
+    for query in ["kubernetes", "azure serverless", "containers apps", "static"]:
+        assert loaded.search(query, 10) == index.search(query, 10)
+
+    loaded.remove("aks")
+    loaded.add("static", "Host a static website on Azure Storage")
+    assert "aks" not in loaded
+    assert loaded.search("static", 10)[0][0] == "static"
+    assert Bm25Index.loads(Bm25Index().dumps()).search("kubernetes", 10) == []
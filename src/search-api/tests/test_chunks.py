@@ -0,0 +1,207 @@
+import asyncio
+import json
+import main
+import math
+import mmh3
+import os
+import pytest
+import qdrant_client.http.models as qmodels
+import tiktoken
+from bm25 import tokenize
+from datetime import datetime
+from models.metadata import MetadataModel
+from qdrant_client import AsyncQdrantClient
+from typing import List
+
+
+def words(count: int, start: int = 0) -> List[str]:
+    return [f"w{i}" for i in range(start, start + count)]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch, word_encoding) -> None:
+    monkeypatch.setattr(main, "INDEX_CHUNK_TOKENS", 10)
+    monkeypatch.setattr(main, "INDEX_CHUNK_OVERLAP_TOKENS", 3)
+    monkeypatch.setattr(main, "INDEX_CHUNKS_MAX", 64)
+
+
+def test_text_chunks_boundaries(small_chunks) -> None:
+    """
+    Tests chunks are bounded in tokens, overlap their neighbours, and cover the whole text in order.
+    """
+    text = words(30)
+    chunks = [chunk.split(" ") for chunk in main.text_chunks(" ".join(text))]
+
+    assert chunks == [text[0:10], text[7:17], text[14:24], text[21:30]]
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous[-3:] == chunk[:3]
+
+
+@pytest.mark.parametrize(
+    "count, expected",
+    [
+        # A text shorter than the overlap is not repeated
+        (2, [(0, 2)]),
+        (10, [(0, 10)]),
+        # The last chunk would only contain the overlap of the previous one
+        (13, [(0, 10), (7, 13)]),
+        (17, [(0, 10), (7, 17)]),
+        (18, [(0, 10), (7, 17), (14, 18)]),
+    ],
+)
+def test_text_chunks_lengths(small_chunks, count: int, expected: list) -> None:
+    """
+    Tests the chunk boundaries around the chunk size.
+    """
+    text = words(count)
+    assert main.text_chunks(" ".join(text)) == [
+        " ".join(text[start:end]) for start, end in expected
+    ]
+
+
+def test_text_chunks_empty(small_chunks) -> None:
+    """
+    Tests an empty text gives a single empty chunk, so the workshop is indexed by its metadata.
+    """
+    assert main.text_chunks("") == [""]
+
+
+def test_text_chunks_max(small_chunks, monkeypatch) -> None:
+    """
+    Tests the number of chunks is capped.
+    """
+    monkeypatch.setattr(main, "INDEX_CHUNKS_MAX", 2)
+    text = words(100)
+    assert main.text_chunks(" ".join(text)) == [
+        " ".join(text[0:10]),
+        " ".join(text[7:17]),
+    ]
+
+
+def test_text_chunks_tokens_limit() -> None:
+    """
+    Tests the chunks, with the metadata of their workshop, fit in an embedding request, with the OpenAI encoding.
+    """
+    try:
+        encoding = tiktoken.encoding_for_model(main.OAI_EMBEDDING_ARGS["model"])
+    except Exception as e:
+        pytest.skip(f"OpenAI encoding not available: {e}")
+
+    text = " ".join(
+        f"Step {i}: run `az group create --name rg-{i}` & check the <output>."
+        for i in range(2000)
+    )
+    chunks = main.text_chunks(text)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        # Words cut at the edges of a chunk can be encoded again in more tokens
+        assert len(encoding.encode(chunk)) <= main.INDEX_CHUNK_TOKENS + 2
+        embedding_text = main.embedding_text_from_metadata(
+            workshop_metadata("Workshop"), "Description", chunk
+        )
+        # Context size of text-embedding-ada-002
+        assert len(encoding.encode(embedding_text)) <= 8191
+
+
+def workshop_metadata(title: str, tags: List[str] = ["azure"]) -> MetadataModel:
+    return MetadataModel(
+        audience=["developers"],
+        authors=["MOAW"],
+        description=title,
+        language="en",
+        last_updated=datetime(2023, 6, 1),
+        tags=tags,
+        title=title,
+        url="https://example.com",
+    )
+
+
+def hashed_vector(text: str) -> List[float]:
+    """
+    Returns a bag of words embedding of a text, as a stand-in for the OpenAI embeddings.
+    """
+    vector = [0.0] * 512
+    for term in tokenize(text):
+        vector[mmh3.hash(term) % len(vector)] += 1
+    norm = math.sqrt(sum(value * value for value in vector)) or 1
+    return [value / norm for value in vector]
+
+
+def recall_at_1(
+    monkeypatch, points: List[qmodels.PointStruct], queries: List[dict]
+) -> float:
+    """
+    Returns the share of queries whose workshop is ranked first by search_dense, over the given points.
+    """
+
+    async def run() -> float:
+        client = AsyncQdrantClient(location=":memory:")
+        await client.create_collection(
+            collection_name=main.QD_COLLECTION,
+            vectors_config=qmodels.VectorParams(
+                distance=qmodels.Distance.COSINE, size=512
+            ),
+        )
+        await client.upsert(collection_name=main.QD_COLLECTION, points=points)
+        monkeypatch.setattr(main, "qd_client", client)
+
+        found = 0
+        for query in queries:
+            hits = await main.search_dense(hashed_vector(query["query"]), 1)
+            found += hits[0].payload["workshop_id"] == query["workshop"]
+        return found / len(queries)
+
+    return asyncio.run(run())
+
+
+def test_chunks_recall(monkeypatch, word_encoding) -> None:
+    """
+    Tests chunked indexing finds the workshops by the end of their content, which was truncated before.
+    """
+    with open(
+        os.path.join(os.path.dirname(__file__), "fixtures", "workshops.json")
+    ) as f:
+        fixtures = json.load(f)
+
+    chunked: List[qmodels.PointStruct] = []
+    truncated: List[qmodels.PointStruct] = []
+    for workshop in fixtures["workshops"]:
+        metadata = workshop_metadata(workshop["title"], workshop["tags"])
+        content = " ".join(
+            [
+                workshop["intro"],
+                *[fixtures["setup"]] * fixtures["setup_repeat"],
+                *workshop["late"],
+            ]
+        )
+        for i, chunk in enumerate(main.text_chunks(content)):
+            text = main.embedding_text_from_metadata(
+                metadata, workshop["description"], chunk
+            )
+            chunked.append(
+                qmodels.PointStruct(
+                    id=main.chunk_id(workshop["id"], i),
+                    payload={"chunk": i, "workshop_id": workshop["id"]},
+                    vector=hashed_vector(text),
+                )
+            )
+
+        # Previous indexing, a single vector of the beginning of the content
+        text = main.embedding_text_from_metadata(
+            metadata, workshop["description"], content[:7500]
+        )
+        truncated.append(
+            qmodels.PointStruct(
+                id=workshop["id"],
+                payload={"workshop_id": workshop["id"]},
+                vector=hashed_vector(text),
+            )
+        )
+
+    assert len(chunked) > len(truncated)
+    recall_chunked = recall_at_1(monkeypatch, chunked, fixtures["queries"])
+    recall_truncated = recall_at_1(monkeypatch, truncated, fixtures["queries"])
+    print(f"Recall@1: chunked {recall_chunked:.2f}, truncated {recall_truncated:.2f}")
+    assert recall_chunked >= recall_truncated
+    assert recall_chunked == 1
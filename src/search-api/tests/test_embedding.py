@@ -0,0 +1,101 @@
+import asyncio
+import main
+import openai
+import pytest
+from types import SimpleNamespace
+from uuid import uuid4
+
+
+@pytest.mark.parametrize(
+    "error, transient",
+    [
+        (openai.error.RateLimitError("slow down"), True),
+        (openai.error.Timeout("timeout"), True),
+        (openai.error.APIConnectionError("reset"), True),
+        (openai.error.ServiceUnavailableError("unavailable"), True),
+        (openai.error.TryAgain("try again"), True),
+        (openai.error.APIError("bad gateway", http_status=502), True),
+        (openai.error.APIError("conflict", http_status=409), False),
+        (
+            openai.error.RateLimitError(
+                "quota", json_body={"error": {"code": "insufficient_quota"}}
+            ),
+            False,
+        ),
+        (openai.error.AuthenticationError("unauthorized"), False),
+        (openai.error.PermissionError("forbidden"), False),
+        (openai.error.InvalidRequestError("too long", None), False),
+        (AttributeError("'str' object has no attribute 'bytes'"), False),
+        (TypeError("unexpected argument"), False),
+    ],
+)
+def test_oai_is_transient(error: BaseException, transient: bool) -> None:
+    """
+    Tests only the transient OpenAI errors are retried.
+    """
+    assert main.oai_is_transient(error) == transient
+
+
+@pytest.fixture
+def small_batches(monkeypatch, word_encoding) -> None:
+    monkeypatch.setattr(main, "OAI_EMBEDDING_BATCH_ITEMS", 3)
+    monkeypatch.setattr(main, "OAI_EMBEDDING_BATCH_TOKENS", 10)
+
+
+def text(tokens: int) -> str:
+    return " ".join(["word"] * tokens)
+
+
+def test_embedding_batches_tokens(small_batches) -> None:
+    """
+    Tests texts are packed in order, a batch is closed before it exceeds the token budget.
+    """
+    texts = [text(4), text(4), text(2), text(3), text(7), text(3)]
+    assert main.embedding_batches(texts) == [[0, 1, 2], [3, 4], [5]]
+
+
+def test_embedding_batches_items(small_batches) -> None:
+    """
+    Tests a batch is closed when it reaches the item budget, even below the token budget.
+    """
+    texts = [text(1)] * 7
+    assert main.embedding_batches(texts) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_embedding_batches_oversized(small_batches) -> None:
+    """
+    Tests a text over the token budget is sent alone, OpenAI rejects it if it is over the model limit.
+    """
+    texts = [text(2), text(25), text(2), text(10)]
+    assert main.embedding_batches(texts) == [[0], [1], [2], [3]]
+    assert main.embedding_batches([text(25)]) == [[0]]
+    assert main.embedding_batches([]) == []
+
+
+def test_embeddings_request_split(monkeypatch) -> None:
+    """
+    Tests a batch rejected as too large is split, until the text rejected alone, whose error is raised.
+    """
+    requests = []
+
+    async def embeddings_create(texts, user):
+        requests.append(len(texts))
+        if any(text == "too long" for text in texts):
+            raise openai.error.InvalidRequestError("too long", None)
+        return SimpleNamespace(
+            data=[
+                SimpleNamespace(index=i, embedding=[float(len(text))])
+                for i, text in reversed(list(enumerate(texts)))
+            ]
+        )
+
+    monkeypatch.setattr(main, "embeddings_create", embeddings_create)
+
+    vectors = asyncio.run(main.embeddings_request(["a", "bb", "ccc", "dddd"], uuid4()))
+    assert vectors == [[1.0], [2.0], [3.0], [4.0]]
+    assert requests == [4]
+
+    requests.clear()
+    with pytest.raises(openai.error.InvalidRequestError):
+        asyncio.run(main.embeddings_request(["a", "bb", "too long", "dddd"], uuid4()))
+    assert requests == [4, 2, 2, 1]
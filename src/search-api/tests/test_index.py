@@ -0,0 +1,127 @@
+import asyncio
+import fakeredis
+import main
+import pytest
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http import models as qmodels
+from types import SimpleNamespace
+from typing import List
+from uuid import UUID
+
+
+# Point of the first chunk has the ID of its workshop, which must be a UUID
+WORKSHOP_IDS = [str(UUID(int=i)) for i in range(4)]
+
+
+def workshop(workshop_id: str) -> dict:
+    return {"id": workshop_id, "lastUpdated": "2023-06-01T00:00:00+00:00"}
+
+
+def index_deleted(monkeypatch, feed: List[str], force: bool) -> List[str]:
+    """
+    Returns the workshops deleted by an indexing of the feed, with all the WORKSHOP_IDS indexed.
+    """
+
+    async def run() -> List[str]:
+        client = AsyncQdrantClient(location=":memory:")
+        await client.create_collection(
+            collection_name=main.QD_COLLECTION,
+            vectors_config=qmodels.VectorParams(distance=main.QD_METRIC, size=1),
+        )
+        await client.upsert(
+            collection_name=main.QD_COLLECTION,
+            points=[
+                qmodels.PointStruct(
+                    id=main.chunk_id(workshop_id, 0),
+                    payload={
+                        "chunk": 0,
+                        "content_hash": main.workshop_hash(workshop(workshop_id)),
+                        "workshop_id": workshop_id,
+                    },
+                    vector=[1.0],
+                )
+                for workshop_id in WORKSHOP_IDS
+            ],
+        )
+        monkeypatch.setattr(main, "qd_client", client)
+        _, _, deleted = await main.index_changes(
+            [workshop(workshop_id) for workshop_id in feed], force
+        )
+        return deleted
+
+    return sorted(asyncio.run(run()))
+
+
+@pytest.mark.parametrize(
+    "feed, force, expected",
+    [
+        # Removals within the ratio
+        (WORKSHOP_IDS[:3], False, WORKSHOP_IDS[3:]),
+        (WORKSHOP_IDS[:2], False, WORKSHOP_IDS[2:]),
+        # Feed truncated or empty
+        (WORKSHOP_IDS[:1], False, []),
+        ([], False, []),
+        # Confirmed by a forced run
+        (WORKSHOP_IDS[:1], True, WORKSHOP_IDS[1:]),
+        ([], True, WORKSHOP_IDS),
+    ],
+)
+def test_index_changes_deleted(
+    monkeypatch, feed: List[str], force: bool, expected: List[str]
+) -> None:
+    assert index_deleted(monkeypatch, feed, force) == expected
+
+
+class FakeSession:
+    """
+    HTTP session answering with a HTTP 304 when the ETag of its content is sent.
+    """
+
+    def __init__(self, etag: str):
+        self.etag = etag
+
+    async def get(self, url: str, headers: dict) -> SimpleNamespace:
+        not_modified = headers.get("If-None-Match") == self.etag
+
+        async def read() -> bytes:
+            return b"" if not_modified else b"[]"
+
+        async def text() -> str:
+            return (await read()).decode("utf-8")
+
+        return SimpleNamespace(
+            headers={"ETag": self.etag},
+            raise_for_status=lambda: None,
+            read=read,
+            status=304 if not_modified else 200,
+            text=text,
+            url=url,
+        )
+
+
+def test_http_get_stats(monkeypatch) -> None:
+    """
+    Tests conditional requests are recorded in the cache statistics, as a hit when not modified.
+    """
+    monkeypatch.setattr(main, "redis_client_api", fakeredis.aioredis.FakeRedis())
+    monkeypatch.setattr(main, "cache_stats", {})
+
+    async def run() -> None:
+        _, _, validator = await main.http_get(
+            main.INDEX_FEED_URL, FakeSession("v1"), True
+        )
+        await main.http_validator_save(validator)
+        content, _, _ = await main.http_get(
+            main.INDEX_FEED_URL, FakeSession("v1"), True
+        )
+        assert content is None
+        content, _, _ = await main.http_get(
+            main.INDEX_FEED_URL, FakeSession("v2"), True
+        )
+        assert content == "[]"
+        # Unconditional requests are not cache lookups
+        await main.http_get(main.INDEX_FEED_URL, FakeSession("v2"), False)
+
+    asyncio.run(run())
+    stats = main.cache_stats["http_validator"]
+    assert (stats.hits, stats.misses) == (1, 2)
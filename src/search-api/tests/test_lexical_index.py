@@ -0,0 +1,29 @@
+import asyncio
+import fakeredis
+import main
+from bm25 import Bm25Index
+
+
+def test_lexical_index_update_concurrent(monkeypatch) -> None:
+    """
+    Tests concurrent updates of the lexical index, from several workers, do not overwrite each other.
+    """
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(main, "lexical_index", Bm25Index())
+    monkeypatch.setattr(main, "redis_client_api", redis)
+
+    async def run() -> Bm25Index:
+        await main.lexical_index_update({"removed": "Workshop removed later"}, [])
+        await asyncio.gather(
+            *[
+                main.lexical_index_update({f"workshop-{i}": f"Workshop number {i}"}, [])
+                for i in range(5)
+            ],
+            main.lexical_index_update({}, ["removed"]),
+        )
+        return Bm25Index.loads(await redis.get(main.LEXICAL_INDEX_KEY))
+
+    index = asyncio.run(run())
+    assert len(index) == 5
+    assert "removed" not in index
+    assert len(main.lexical_index) == 5
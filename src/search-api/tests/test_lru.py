@@ -0,0 +1,98 @@
+import lru
+import pytest
+from lru import LruCache
+
+
+@pytest.fixture
+def clock(monkeypatch) -> list:
+    """
+    Replaces the clock of the cache, the returned list holds the current time.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(lru.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_capacity() -> None:
+    """
+    Tests the cache never holds more entries than its size.
+    """
+    cache: LruCache[int] = LruCache(size=3, ttl=60)
+    for i in range(10):
+        cache.set(i, i)
+        assert len(cache._entries) <= 3
+
+    assert [cache.get(i) for i in range(10)] == [None] * 7 + [7, 8, 9]
+
+
+def test_eviction_order() -> None:
+    """
+    Tests the least recently used entry is evicted first.
+    """
+    cache: LruCache[str] = LruCache(size=3, ttl=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.set("c", "C")
+    cache.set("d", "D")
+
+    assert cache.get("a") is None
+    assert (cache.get("b"), cache.get("c"), cache.get("d")) == ("B", "C", "D")
+
+
+def test_get_refreshes_recency() -> None:
+    """
+    Tests a read entry becomes the most recently used, and is evicted last.
+    """
+    cache: LruCache[str] = LruCache(size=3, ttl=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    cache.set("c", "C")
+
+    assert cache.get("a") == "A"
+    cache.set("d", "D")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+
+    # Overwriting an entry also refreshes it
+    cache.set("c", "C2")
+    cache.set("e", "E")
+    assert cache.get("d") is None
+    assert (cache.get("a"), cache.get("c"), cache.get("e")) == ("A", "C2", "E")
+
+
+def test_get_does_not_extend_ttl(clock: list) -> None:
+    """
+    Tests entries expire after their TTL, even when read meanwhile, and a custom TTL is respected.
+    """
+    cache: LruCache[str] = LruCache(size=3, ttl=60)
+    cache.set("a", "A")
+    cache.set("b", "B", ttl=10)
+
+    clock[0] += 9
+    assert cache.get("a") == "A"
+    assert cache.get("b") == "B"
+
+    clock[0] += 2
+    assert cache.get("b") is None
+    assert cache.get("a") == "A"
+
+    clock[0] += 50
+    assert cache.get("a") is None
+    assert len(cache._entries) == 0
+
+
+def test_delete_clear() -> None:
+    """
+    Tests entries can be deleted, unknown ones are ignored.
+    """
+    cache: LruCache[str] = LruCache(size=3, ttl=60)
+    cache.set("a", "A")
+    cache.set("b", "B")
+
+    cache.delete("a")
+    cache.delete("unknown")
+    assert cache.get("a") is None
+    assert cache.get("b") == "B"
+
+    cache.clear()
+    assert cache.get("b") is None
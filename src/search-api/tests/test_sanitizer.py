@@ -0,0 +1,81 @@
+import pytest
+from sanitizer import sanitize_for_embedding
+
+
+# Outputs are pinned from the regex chain sanitize_for_embedding replaced, they must not change
+CASES = {
+    "page": (
+        """<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Deploy a container app</title>
+  <style>body { margin: 0; }</style>
+  <script>var ready = 1 < 2;</script>
+</head>
+<body>
+  <script src="analytics.js"></script>
+  <h1 id="intro">Deploy a container app</h1>
+  <p>Use <strong>Azure Container Apps</strong> to run <em>serverless</em> containers &amp; jobs.</p>
+  <style>.tip { color: blue; }</style>
+  <div class="tip">Step&nbsp;1 &lt;required&gt;</div>
+</body>
+</html>
+""",
+        "Deploy a container app Use Azure Container Apps to run serverless containers & jobs. Step\xa01 <required>",
+    ),
+    "markdown": (
+        """# Workshop: AKS basics
+
+**Duration:** 2 hours, _level_ ~~beginner~~ intermediate.
+
+| Step | Description |
+|------|-------------|
+| 1 | Create the cluster |
+| 2 | Deploy the app |
+
+```bash
+az aks create --name demo --resource-group rg
+```
+
+Read the [documentation](https://learn.microsoft.com/azure/aks) and look at ![diagram](assets/aks.png).
+
+---
+
+> Tip: use `kubectl get pods` to check the status, and A&amp;B &#169; 2023.
+""",
+        "Workshop: AKS basics Duration: 2 hours, level beginner intermediate. Step Description 1 Create the cluster 2 Deploy the app Read the documentation (https://learn.microsoft.com/azure/aks) and look at diagram (assets/aks.png). Tip: use kubectl get pods to check the status, and A&B & 169; 2023.",
+    ),
+    "nested": (
+        """<p>Before</p>
+<script>document.write("<style>.a { color: red; }</style>");</script>
+<p>Between</p>
+<style>.b::after { content: "<script>alert(1)</script>"; }</style>
+<p>After</p>
+""",
+        "Before Between After",
+    ),
+    "interleaved": (
+        """<p>One</p><script>var a = "<style>";</script><p>Two</p><style>.c {}</style><p>Three</p>
+<style>.d { content: "<script>"; }</style><p>Four</p><script>var b = "</style>";</script><p>Five</p>
+""",
+        'One Two Three .d { content: " Five',
+    ),
+    "sequential": (
+        """<script type="module">import x from "y";</script>Text<script>
+var multi = "line";
+</script><style media="print">
+p { display: none; }
+</style>End""",
+        "Text End",
+    ),
+    "empty": ("", ""),
+}
+
+
+@pytest.mark.parametrize("raw, expected", CASES.values(), ids=CASES.keys())
+def test_sanitize_for_embedding(raw: str, expected: str) -> None:
+    """
+    Tests the sanitization of representative workshop pages against the pinned outputs.
+    """
+    assert sanitize_for_embedding(raw) == expected
@@ -0,0 +1,31 @@
+import asyncio
+import inspect
+import main
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from uuid import UUID
+
+
+def test_scheduler_index_job(monkeypatch) -> None:
+    """
+    Tests the indexing job is called with a user, the way the scheduler calls it.
+    """
+    users = []
+
+    async def index_engine(user: UUID, force: bool = False) -> None:
+        users.append(user.bytes)
+
+    # Real function must accept the arguments of the job
+    real_index_engine = main.index_engine
+    monkeypatch.setattr(main, "index_engine", index_engine)
+    monkeypatch.setattr(
+        main, "scheduler", AsyncIOScheduler(jobstores={"redis": MemoryJobStore()})
+    )
+    main.scheduler_jobs_add()
+
+    job = main.scheduler.get_job("index")
+    bound = inspect.signature(real_index_engine).bind(*job.args, **job.kwargs)
+    assert isinstance(bound.arguments["user"], UUID)
+
+    asyncio.run(job.func(*job.args, **job.kwargs))
+    assert len(users) == 1
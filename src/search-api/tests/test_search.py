@@ -0,0 +1,171 @@
+import asyncio
+import fakeredis
+import main
+from bm25 import Bm25Index
+from datetime import datetime, timezone
+from models.metadata import MetadataModel
+from models.search import SearchAnswerModel, SearchModel, SearchStatsModel
+from types import SimpleNamespace
+from typing import List
+from uuid import UUID, uuid4
+
+
+def workshop_payload(workshop_id: str, title: str) -> dict:
+    return {
+        "audience": ["developers"],
+        "authors": ["MOAW"],
+        "description": f"Description of {title}",
+        "language": "en",
+        "last_updated": "2023-06-01T00:00:00",
+        "tags": ["azure"],
+        "title": title,
+        "url": f"https://example.com/{workshop_id}/",
+        "workshop_id": workshop_id,
+    }
+
+
+WORKSHOP_AKS = str(UUID(int=1))
+WORKSHOP_FUNCTIONS = str(UUID(int=2))
+
+
+def search_answer(monkeypatch, lexical: Bm25Index, dense: List[str]) -> dict:
+    """
+    Returns the scores of search_answer, by workshop ID, with the dense hits in the given order.
+    """
+
+    async def search_dense(vector: List[float], limit: int) -> list:
+        return [
+            SimpleNamespace(payload=workshop_payload(workshop_id, workshop_id))
+            for workshop_id in dense
+        ]
+
+    # Workshops only found by the lexical index are fetched by their first chunk
+    async def retrieve(collection_name: str, ids: List[str], **kwargs) -> list:
+        workshop_ids = {
+            main.chunk_id(workshop_id, 0): workshop_id
+            for workshop_id in (WORKSHOP_AKS, WORKSHOP_FUNCTIONS)
+        }
+        return [
+            SimpleNamespace(
+                id=id, payload=workshop_payload(workshop_ids[id], workshop_ids[id])
+            )
+            for id in ids
+        ]
+
+    monkeypatch.setattr(main, "lexical_index", lexical)
+    monkeypatch.setattr(main, "qd_client", SimpleNamespace(retrieve=retrieve))
+    monkeypatch.setattr(main, "search_dense", search_dense)
+    answers = asyncio.run(main.search_answer("kubernetes cluster", [0.1, 0.2], 10))
+    return {str(answer.id): answer.score for answer in answers}
+
+
+def test_search_answer_dense_only(monkeypatch) -> None:
+    """
+    Tests the best dense hit scores 1 when the lexical index finds nothing.
+    """
+    scores = search_answer(monkeypatch, Bm25Index(), [WORKSHOP_AKS, WORKSHOP_FUNCTIONS])
+    assert scores[WORKSHOP_AKS] == 1
+    assert scores[WORKSHOP_FUNCTIONS] < 1
+
+
+def test_search_answer_fused(monkeypatch) -> None:
+    """
+    Tests a workshop ranked first by both retrievers scores 1, and one ranked first by only one of them is halved.
+    """
+    lexical = Bm25Index()
+    lexical.add(WORKSHOP_AKS, "Deploy a Kubernetes cluster with AKS")
+    lexical.add(WORKSHOP_FUNCTIONS, "Serverless APIs with Azure Functions")
+    scores = search_answer(monkeypatch, lexical, [WORKSHOP_AKS])
+    assert scores == {WORKSHOP_AKS: 1}
+
+    scores = search_answer(monkeypatch, lexical, [WORKSHOP_FUNCTIONS])
+    assert scores[WORKSHOP_AKS] == 0.5
+    assert scores[WORKSHOP_FUNCTIONS] == 0.5
+
+
+def search_model() -> SearchModel:
+    return SearchModel(
+        answers=[
+            SearchAnswerModel(
+                id=UUID(WORKSHOP_AKS),
+                metadata=MetadataModel(**workshop_payload(WORKSHOP_AKS, "AKS")),
+                score=1,
+            ),
+            SearchAnswerModel(
+                id=UUID(WORKSHOP_FUNCTIONS),
+                metadata=MetadataModel(
+                    **{
+                        **workshop_payload(
+                            WORKSHOP_FUNCTIONS, "Functions – “quoted” ✓"
+                        ),
+                        "last_updated": datetime(
+                            2023, 6, 2, 8, 30, tzinfo=timezone.utc
+                        ),
+                        "tags": [],
+                    }
+                ),
+                score=0.25,
+            ),
+        ],
+        query="kubernetes cluster",
+        stats=SearchStatsModel(time=0.125, total=42),
+        suggestion_token=uuid4(),
+    )
+
+
+def test_search_entry_round_trip() -> None:
+    """
+    Tests a search entry loaded without validation equals the validated model, nested answers and metadata included.
+    """
+    search = search_model()
+    validated = SearchModel.parse_raw(search.json())
+
+    for raw in [search.json().encode("utf-8"), main.search_entry_dumps(search)]:
+        loaded = main.search_entry_loads(raw)
+        assert loaded == validated
+        assert loaded.dict() == search.dict()
+        # Types are the ones of the validated model, not the JSON ones
+        for answer, expected in zip(loaded.answers, validated.answers):
+            assert type(answer) is SearchAnswerModel
+            assert type(answer.metadata) is MetadataModel
+            assert answer.metadata.last_updated == expected.metadata.last_updated
+            assert type(answer.id) is UUID
+        assert type(loaded.stats) is SearchStatsModel
+        assert type(loaded.suggestion_token) is UUID
+        # Entry is served as is, it must serialize as the validated model
+        assert loaded.json() == validated.json()
+
+
+def test_search_entry_fields() -> None:
+    """
+    Tests all the fields of the models are set by search_entry_loads, so a field added to a model is not silently dropped.
+    """
+    loaded = main.search_entry_loads(main.search_entry_dumps(search_model()))
+
+    assert loaded.__fields_set__ == set(SearchModel.__fields__)
+    assert loaded.stats.__fields_set__ == set(SearchStatsModel.__fields__)
+    for answer in loaded.answers:
+        assert answer.__fields_set__ == set(SearchAnswerModel.__fields__)
+        assert answer.metadata.__fields_set__ == set(MetadataModel.__fields__)
+
+
+def test_search_from_token_stats(monkeypatch) -> None:
+    """
+    Tests suggestion token lookups are recorded in the cache statistics, references included.
+    """
+    redis = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(main, "redis_client_api", redis)
+    monkeypatch.setattr(main, "cache_stats", {})
+    search = search_model()
+
+    async def run() -> None:
+        await main.search_store(search, search.query, "search-cached")
+        assert await main.search_from_token(str(search.suggestion_token))
+        assert not await main.search_from_token(str(uuid4()))
+        # Cached entry expired before the token referencing it
+        await redis.delete("search-cached")
+        assert not await main.search_from_token(str(search.suggestion_token))
+
+    asyncio.run(run())
+    stats = main.cache_stats["token"]
+    assert (stats.hits, stats.misses) == (1, 2)
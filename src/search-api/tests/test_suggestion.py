@@ -0,0 +1,23 @@
+import asyncio
+import fakeredis
+import main
+
+
+def test_readers_decrement() -> None:
+    """
+    Tests readers leaving never bring the counter below zero, even after it expired.
+    """
+    redis = fakeredis.aioredis.FakeRedis()
+
+    async def run() -> None:
+        await redis.set("registered", 2)
+        assert await main.redis_decr_positive(keys=["registered"], client=redis) == 1
+        assert await main.redis_decr_positive(keys=["registered"], client=redis) == 0
+        assert await main.redis_decr_positive(keys=["registered"], client=redis) == 0
+        assert int(await redis.get("registered")) == 0
+
+        # Counter expired while its readers were still connected
+        assert await main.redis_decr_positive(keys=["expired"], client=redis) == 0
+        assert not await redis.exists("expired")
+
+    asyncio.run(run())
@@ -1,8 +1,7 @@
 import "./app.scss";
 import { Helmet } from "react-helmet-async";
 import { helmetJsonLdProp } from "react-schemaorg";
-import { useState, useEffect, useMemo } from "react";
-import axios from "axios";
+import { useState, useMemo } from "react";
 import Error from "./Error";
 import FingerprintJS from "@fingerprintjs/fingerprintjs";
 import Result from "./Result";
@@ -21,7 +20,6 @@ function App() {
   const [stats, setStats] = useState(null);
   const [suggestion, setSuggestion] = useState(null);
   const [suggestionLoading, setSuggestionLoading] = useState(null);
-  const [suggestionToken, setSuggestionToken] = useState(null);
   // Persistance
   const [F, setF] = useLocalStorageState("F", { defaultValue: null });
 
@@ -32,75 +30,71 @@ function App() {
       .then((res) => setF(res.visitorId));
   }, []);
 
-  // Fetch the suggestion
-  useEffect(() => {
-    if (!suggestionToken) return;
-    if (!F) return;
+  const fetchAnswers = async (value) => {
+    // Close previous connection
+    if (suggestionLoading) suggestionLoading.close();
 
     // Reset UI
+    setAnswersLoading(true);
     setError(null);
     setSuggestion(null);
 
-    // Close previous connection
-    if (suggestionLoading) suggestionLoading.close();
+    // Open new connection, the results and the suggestion are streamed on it
+    const params = new URLSearchParams({ limit: 10, query: value, user: F });
+    const source = new EventSource(`${API_BASE_URL}/search/stream?${params}`);
+    // Store the connection to be able to close it later
+    setSuggestionLoading(source);
 
-    const fetch = async () => {
-      // Open new connection
-      const source = new EventSource(`${API_BASE_URL}/suggestion/${suggestionToken}?user=${F}`);
-      // Store the connection to be able to close it later
-      setSuggestionLoading(source);
+    let answered = false;
+    const onAnswers = (event) => {
+      const res = JSON.parse(event.data);
+      answered = true;
+      setAnswers(res.answers);
+      setStats(res.stats);
+    };
 
-      let suggestion = "";
-      source.onmessage = (event) => {
-        suggestion += event.data;
-        setSuggestion(suggestion);
-      };
+    // Lexical results, sent while the search is running
+    source.addEventListener("preview", onAnswers);
 
-      source.onerror = (event) => {
-        if (event.eventPhase === EventSource.CLOSED) {
-          setSuggestionLoading(null);
-          source.close();
-        }
-      }
+    source.addEventListener("results", (event) => {
+      onAnswers(event);
+      setAnswersLoading(false);
+    });
+
+    let suggestion = "";
+    source.onmessage = (event) => {
+      suggestion += event.data;
+      setSuggestion(suggestion);
     };
 
-    fetch();
-  }, [suggestionToken, F]);
+    // Generation restarted on the server, drop the partial suggestion
+    source.addEventListener("reset", () => {
+      suggestion = "";
+      setSuggestion(null);
+    });
 
-  const fetchAnswers = async (value) => {
-    setAnswersLoading(true);
-    setError(null);
-    await axios
-      .get(`${API_BASE_URL}/search`, {
-        params: {
-          limit: 10,
-          query: value,
-          user: F,
-        },
-        timeout: 30000,
-      })
-      .then((res) => {
-        if (res.data) {
-          setAnswers(res.data.answers);
-          setStats(res.data.stats);
-          setSuggestionToken(res.data.suggestion_token);
-        } else {
-          // Hardcoded error message ; functionally, this is due to a moderated query
-          setError({ code: res.status, message: "No results" });
-          // Reset UI
-          setAnswers(null);
-          setStats(null);
-          setSuggestion(null);
-        }
-      })
-      .catch((error) => {
-        setError({ code: error.code, message: error.message });
+    // Stream is complete, close it before the browser reconnects
+    source.addEventListener("end", () => {
+      setSuggestionLoading(null);
+      source.close();
+    });
+
+    source.onerror = () => {
+      // Connection lost during the suggestion, the browser reconnects with the last event ID and the suggestion is resumed
+      if (answered && source.readyState === EventSource.CONNECTING) return;
+
+      if (!answered) {
+        // Hardcoded error message ; functionally, this is due to a moderated query, answered with a HTTP 204
+        setError({ code: "ERR_STREAM", message: "No results" });
         // Reset UI
         setAnswers(null);
         setStats(null);
         setSuggestion(null);
-      })
-      .finally(() => setAnswersLoading(false));
+      }
+      setAnswersLoading(false);
+      setSuggestionLoading(null);
+      source.close();
+    };
   };
 
   return (